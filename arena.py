@@ -0,0 +1,117 @@
+'''compact storage of formulas as rows of typed arrays
+
+An Arena keeps every formula added to it as a row of parallel arrays: the
+opcode, a small argument (the predicate, the connective or the number of
+quantified variables) and two integers (the children, or the position and
+number of the terms of an atom, or the nesting level of a quantifier). The
+terms of the atoms are numbers into a table of terms. Rows are interned, so
+alpha-equivalent formulas and common subformulas share a row, and no
+Formula object is kept alive by the arena.
+
+The variables of a quantifier are replaced by the placeholders of its
+nesting level, which the arena stores like any other term.
+'''
+from array import array
+from formula import (Term, PredicateFormula, Negation, BinaryConnective,
+                     UniversalQuantifier, ExistentialQuantifier)
+
+PRED, NEG, BIN, UNI, EX = range(5)
+
+CONNECTIVES = ['&', '|', '->']
+
+
+def placeholders(table, level, n):
+    '''the first n placeholder terms of the quantifiers at nesting level'''
+    while len(table) <= level:
+        table.append([])
+    terms = table[level]
+    while len(terms) < n:
+        terms.append(Term())
+    return terms[:n]
+
+
+class Arena(object):
+    def __init__(self):
+        self.opcodes = array('B')
+        self.arguments = array('H')
+        self.first = array('i')
+        self.second = array('i')
+        self.term_numbers = array('i')
+        self.terms = []
+        self.predicates = []
+        self._rows = {}
+        self._numbers = {}
+        self._predicate_numbers = {}
+        self._placeholders = []
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def nbytes(self):
+        '''bytes used by the arrays'''
+        return sum(a.itemsize * len(a) for a in (
+            self.opcodes, self.arguments, self.first, self.second, self.term_numbers))
+
+    def add(self, formula, level=0):
+        '''the row of formula, adding it and its subformulas if needed'''
+        if isinstance(formula, PredicateFormula):
+            numbers = tuple(self._number(t) for t in formula.terms)
+            key = (PRED, self._predicate(formula.predicate), numbers)
+            row = self._rows.get(key)
+            if row is None:
+                offset = len(self.term_numbers)
+                self.term_numbers.extend(numbers)
+                row = self._row(key, PRED, key[1], offset, len(numbers))
+            return row
+        if isinstance(formula, Negation):
+            key = (NEG, 0, self.add(formula.formula, level), 0)
+        elif isinstance(formula, BinaryConnective):
+            key = (BIN, CONNECTIVES.index(formula.connective),
+                   self.add(formula.left, level), self.add(formula.right, level))
+        else:
+            n = len(formula.terms)
+            body = formula.open(placeholders(self._placeholders, level, n))
+            key = (UNI if formula.tag == 'Uni' else EX, n, level, self.add(body, level + 1))
+        row = self._rows.get(key)
+        if row is None:
+            row = self._row(key, *key)
+        return row
+
+    def _row(self, key, opcode, argument, first, second):
+        row = self._rows[key] = len(self.opcodes)
+        self.opcodes.append(opcode)
+        self.arguments.append(argument)
+        self.first.append(first)
+        self.second.append(second)
+        return row
+
+    def _number(self, term):
+        number = self._numbers.get(term)
+        if number is None:
+            number = self._numbers[term] = len(self.terms)
+            self.terms.append(term)
+        return number
+
+    def _predicate(self, predicate):
+        number = self._predicate_numbers.get(predicate)
+        if number is None:
+            number = self._predicate_numbers[predicate] = len(self.predicates)
+            self.predicates.append(predicate)
+        return number
+
+    def formula(self, row):
+        '''the formula stored in row'''
+        opcode = self.opcodes[row]
+        argument = self.arguments[row]
+        first = self.first[row]
+        second = self.second[row]
+        if opcode == PRED:
+            terms = self.terms
+            return self.predicates[argument](
+                *(terms[i] for i in self.term_numbers[first:first + second]))
+        if opcode == NEG:
+            return Negation(self.formula(first))
+        if opcode == BIN:
+            return BinaryConnective(self.formula(first), CONNECTIVES[argument], self.formula(second))
+        quantifier = UniversalQuantifier if opcode == UNI else ExistentialQuantifier
+        return quantifier(placeholders(self._placeholders, first, argument), self.formula(second))
@@ -0,0 +1,347 @@
+'''benchmarks of the verifier
+
+The scaling benchmark runs the library of main.py and synthetic workloads
+of growing size: chains of Thm_2_3 transitivity, nested contexts, deep
+formulas, quantifiers over many variables and many facts. For each
+scenario and size it reports the best of five timings and the peak memory
+traced, compared with the baselines stored in benchmark_baseline.json by
+the baseline benchmark; a scenario slower or larger than its baseline by
+more than its TOLERANCE is reported as a regression and the exit status is 1.
+Every scenario runs in a new process, so that the terms, formulas and
+caches left by the others do not change its results.
+
+usage: python benchmark.py [benchmark ...]
+'''
+import gc
+import json
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from proof import ProofContext
+from log import SilentLog
+from tarski import axioms, equality_axioms, Between, Congruent, Equal
+from search import prove_statement
+from rete import Saturation
+from formula import Formula, Term, HashConsing, UniversalQuantifier
+from arena import Arena
+
+CHAPTER_2 = ['Thm_2_1', 'Thm_2_2', 'Thm_2_3', 'Thm_2_4', 'Thm_2_5', 'Thm_2_5_bis']
+
+
+def library():
+    '''the module main.py with its theorem library verified'''
+    import main
+    main.library.verify_all()
+    return main
+
+
+def report(name, nodes, elapsed):
+    print('%-12s %8d nodes %8.3f s %10.0f nodes/s' % (name, nodes, elapsed, nodes / elapsed))
+
+
+def bench_search():
+    '''rediscover the chapter 2 theorems with the proof search'''
+    main = library()
+    p = ProofContext(axioms+equality_axioms, log=SilentLog())
+    nodes = elapsed = 0
+    for name in CHAPTER_2:
+        statement = getattr(main, name)
+        proved, search = prove_statement(p, statement, max_depth=6)
+        assert proved == statement, name
+        report(name, search.nodes, search.elapsed)
+        nodes += search.nodes
+        elapsed += search.elapsed
+    report('total', nodes, elapsed)
+
+
+def saturated_context(max_depth=3, max_fired=2000):
+    '''the library context with a chapter 3 configuration saturated by forward chaining'''
+    p = library().p
+    a, b, c, d = p.start_context_names('abcd')
+    p.assume(Between(a,b,c))
+    p.assume(Between(a,c,d))
+    p.assume(Congruent(a,b,c,d))
+    p.assume(-Equal(b,c))
+    return p, Saturation(p, max_depth=max_depth, max_fired=max_fired)
+
+
+def bench_saturation():
+    '''forward chaining of the library theorems on a chapter 3 configuration'''
+    library()
+    start = time.perf_counter()
+    p, saturation = saturated_context()
+    elapsed = time.perf_counter() - start
+    print('%-12s %8d rules fired %8.3f s %10.0f rules/s' % (
+        'saturation', saturation.fired, elapsed, saturation.fired / elapsed))
+
+
+def bench_specialise(repeat=2000):
+    '''specialise the five segment axiom, variable by variable and at once'''
+    axiom = axioms[4]
+    terms = [Term() for _ in axiom.terms]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        formula = axiom
+        for i, t in reversed(list(enumerate(terms))):
+            formula = formula.specialise(i, t)
+    elapsed = time.perf_counter() - start
+    print('%-12s %8d calls %8.3f s %10.0f calls/s' % ('stepwise', repeat, elapsed, repeat / elapsed))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        assert axiom.specialise_terms(terms) == formula
+    elapsed = time.perf_counter() - start
+    print('%-12s %8d calls %8.3f s %10.0f calls/s' % ('at once', repeat, elapsed, repeat / elapsed))
+
+
+def bench_allocations():
+    '''formula nodes constructed while verifying the library of main.py'''
+    lib = library().library
+    p = lib.namespace['p']
+    counts = Counter()
+    construct = HashConsing.__call__
+
+    def counting(cls, *args):
+        counts[cls.__name__] += 1
+        return construct(cls, *args)
+
+    HashConsing.__call__ = counting
+    lib.namespace['p'] = ProofContext(axioms+equality_axioms, log=SilentLog())
+    try:
+        for theorem in lib.theorems.values():
+            lib.check(theorem)
+    finally:
+        HashConsing.__call__ = construct
+        lib.namespace['p'] = p
+    for name, n in counts.most_common():
+        print('%-28s %8d' % (name, n))
+    print('%-28s %8d' % ('total', sum(counts.values())))
+
+
+def footprint(objects):
+    '''bytes of the formulas, terms, tuples and dicts reachable from objects'''
+    seen = set()
+    pending = list(objects)
+    size = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or not isinstance(obj, (Formula, Term, tuple, dict)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        attributes = getattr(obj, '__dict__', None)
+        if attributes is not None and id(attributes) not in seen:
+            seen.add(id(attributes))
+            size += sys.getsizeof(attributes)
+            pending.extend(attributes.values())
+        pending.extend(gc.get_referents(obj))
+    return size
+
+
+def bench_memory():
+    '''bytes per fact derived by saturating a chapter 3 configuration'''
+    library()
+    tracemalloc.start()
+    p, saturation = saturated_context()
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    facts = list(p.facts.scope())
+    arena = Arena()
+    for fact in facts:
+        assert arena.formula(arena.add(fact)) == fact
+    n = len(facts)
+    print('%-12s %8d facts %8.0f bytes/fact' % ('traced', n, traced / n))
+    print('%-12s %8d facts %8.0f bytes/fact' % ('objects', n, footprint(facts) / n))
+    print('%-12s %8d rows  %8.0f bytes/fact' % ('arena', len(arena), arena.nbytes() / n))
+
+
+# scaling scenarios: each runs a workload of size n in a new context
+
+def new_context(*theorems):
+    p = ProofContext(axioms+equality_axioms, log=SilentLog())
+    for theorem in theorems:
+        p.recall(theorem)
+    return p
+
+
+def scenario_library(n):
+    '''verify the first n theorems of main.py'''
+    import main
+    lib = main.library
+    saved, cache = lib.namespace['p'], lib.cache
+    lib.namespace['p'], lib.cache = new_context(), None
+    try:
+        for theorem in list(lib.theorems.values())[:n]:
+            lib.check(theorem)
+    finally:
+        lib.namespace['p'], lib.cache = saved, cache
+
+
+def scenario_chain(n):
+    '''a chain of n applications of the transitivity Thm_2_3'''
+    import main
+    p = new_context(main.Thm_2_3)
+    t = p.start_context(2 * n + 4)
+    last = p.assume(Congruent(*t[:4]))
+    for i in range(2, 2 * n + 2, 2):
+        step = p.assume(Congruent(*t[i:i + 4]))
+        p.conjunction(last, step)
+        last = p.modus_ponens(p.specialise(main.Thm_2_3, t[:2] + t[i:i + 4]))
+    p.directproof(last)
+
+
+def scenario_nesting(n):
+    '''n nested contexts, each with a variable and an assumption'''
+    p = new_context()
+    for _ in range(n):
+        x, = p.start_context(1)
+        last = p.assume(Equal(x, x))
+    for _ in range(n):
+        last = p.directproof(last)
+
+
+def scenario_depth(n):
+    '''split a conjunction of n atoms nested n deep'''
+    p = new_context()
+    t = p.start_context(n + 1)
+    conjunction = Equal(t[0], t[1])
+    for i in range(1, n):
+        conjunction = conjunction & Equal(t[i], t[i + 1])
+    p.deduce_all(p.assume(conjunction))
+    p.abandon()
+
+
+def scenario_variables(n):
+    '''specialise a quantifier over n variables n times'''
+    bound = [Term() for _ in range(n)]
+    body = Equal(bound[0], bound[1])
+    for i in range(1, n - 1):
+        body = body & Equal(bound[i], bound[i + 1])
+    fact = UniversalQuantifier(bound, body)
+    p = new_context(fact)
+    t = p.start_context(n)
+    for i in range(n):
+        p.specialise(fact, t[i:] + t[:i])
+    p.abandon()
+
+
+def scenario_facts(n):
+    '''add n atoms to a context and look each of them up'''
+    p = new_context()
+    t = p.start_context(n + 1)
+    for i in range(n):
+        p.assume(Between(t[0], t[i], t[i + 1]))
+    for i in range(n):
+        assert p.find(Between, None, t[i], t[i + 1])
+    p.abandon()
+
+
+def scenario_lemmas(n):
+    '''file n lemmas about different terms and look each of them up'''
+    p = new_context()
+    x, y = Term(), Term()
+    t = p.start_context(n + 2)
+    a, b = t[n:]
+    for i in range(n):
+        p.assume(UniversalQuantifier((x, y), Congruent(x, y, t[i], t[i]) > Between(x, t[i], y)))
+    for i in range(n):
+        assert len(p.index.generalisations(Between(a, t[i], b))) == 1
+    p.abandon()
+
+
+SCENARIOS = [
+    ('library', scenario_library, [10, 25]),
+    ('chain', scenario_chain, [10, 100, 400]),
+    ('nesting', scenario_nesting, [10, 100, 400]),
+    ('depth', scenario_depth, [10, 100, 400]),
+    ('variables', scenario_variables, [4, 16, 64]),
+    ('facts', scenario_facts, [100, 1000, 5000]),
+    ('lemmas', scenario_lemmas, [100, 1000, 2000]),
+]
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# relative slowdown or growth of the peak memory reported as a regression;
+# timings differing by less than SLACK seconds are noise. Reruns on a busy
+# machine vary by up to 80% in time, while the peak of a new process varies
+# by a few hundred bytes.
+TOLERANCE = {'time': 1.0, 'peak': 0.05}
+SLACK = {'time': 0.01, 'peak': 0}
+
+
+def measure(scenario, n, repeat=5):
+    '''the best time of repeat runs of scenario and its peak traced memory,
+    measured in a new process'''
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_measure, scenario, n, repeat).result()
+
+
+def _measure(scenario, n, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        scenario(n)
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    scenario(n)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'time': min(times), 'peak': peak}
+
+
+def run_scenarios():
+    results = {}
+    for name, scenario, sizes in SCENARIOS:
+        for n in sizes:
+            results['%s/%d' % (name, n)] = measure(scenario, n)
+    return results
+
+
+def bench_scaling():
+    '''the scenarios compared with their baselines'''
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    regressions = []
+    for key, result in run_scenarios().items():
+        old = baseline.get(key)
+        flags = [field for field in ('time', 'peak')
+                 if old and result[field] > old[field] * (1 + TOLERANCE[field]) + SLACK[field]]
+        print('%-16s %8.4f s %10.0f kB peak %s' % (
+            key, result['time'], result['peak'] / 1024,
+            'REGRESSION ' + ', '.join(flags) if flags else ''))
+        if flags:
+            regressions.append(key)
+    if regressions:
+        sys.exit(1)
+
+
+def bench_baseline():
+    '''run the scenarios and store the results as the baselines'''
+    results = run_scenarios()
+    for key, result in results.items():
+        print('%-16s %8.4f s %10.0f kB peak' % (key, result['time'], result['peak'] / 1024))
+    with open(BASELINE, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+
+
+BENCHMARKS = {
+    'search': bench_search,
+    'saturation': bench_saturation,
+    'memory': bench_memory,
+    'specialise': bench_specialise,
+    'allocations': bench_allocations,
+    'scaling': bench_scaling,
+    'baseline': bench_baseline,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or [name for name in BENCHMARKS if name != 'baseline']:
+        print('==', name)
+        BENCHMARKS[name]()
@@ -0,0 +1,166 @@
+'''congruence closure of the Equal facts in scope
+
+The terms known to be equal are kept in a union-find structure, together
+with a proof forest recording which Equal fact joined which terms. Both are
+changed through an undo log, so closing a context only reverts the merges
+made inside it. Without function symbols congruence of two formulas means
+the same shape with equal terms at every position, and a proof of it is a
+sequence of substitute_equal steps along the paths of the proof forest.
+
+Path compression would not survive the undo log, so find is logarithmic
+through union by size.
+'''
+from formula import PredicateFormula, Negation, BinaryConnective
+from tarski import Equal
+
+_MISSING = object()
+
+
+def atoms(formula):
+    '''the atoms of a quantifier free formula from left to right'''
+    if isinstance(formula, PredicateFormula):
+        return [formula]
+    if isinstance(formula, Negation):
+        return atoms(formula.formula)
+    assert isinstance(formula, BinaryConnective), 'quantified formula'
+    return atoms(formula.left) + atoms(formula.right)
+
+
+def terms(formula):
+    return [t for atom in atoms(formula) for t in atom.terms]
+
+
+def rebuild(formula, terms):
+    '''formula with the terms at its positions replaced by terms'''
+    return _rebuild(formula, iter(terms))
+
+
+def _rebuild(formula, terms):
+    if isinstance(formula, PredicateFormula):
+        return formula.predicate(*(next(terms) for _ in formula.terms))
+    if isinstance(formula, Negation):
+        return Negation(_rebuild(formula.formula, terms))
+    left = _rebuild(formula.left, terms)
+    return BinaryConnective(left, formula.connective, _rebuild(formula.right, terms))
+
+
+def same_shape(formula, other):
+    if type(formula) is not type(other):
+        return False
+    if isinstance(formula, PredicateFormula):
+        return formula.predicate is other.predicate
+    if isinstance(formula, Negation):
+        return same_shape(formula.formula, other.formula)
+    return (formula.connective == other.connective and
+            same_shape(formula.left, other.left) and
+            same_shape(formula.right, other.right))
+
+
+class EqualityClosure(object):
+    '''classes of terms equal by the Equal facts in scope of a ProofContext'''
+    def __init__(self, context):
+        self.context = context
+        self._parent = {}
+        self._size = {}
+        self._proof = {}
+        self._log = []
+        for identity in context.find(Equal, None, None):
+            self._merge(identity, context.facts.level(identity))
+        context.listeners.append(self)
+
+    def close(self):
+        self.context.listeners.remove(self)
+
+    def _set(self, table, key, value, level):
+        self._log.append((level, table, key, table.get(key, _MISSING)))
+        table[key] = value
+
+    def fact_added(self, fact):
+        if isinstance(fact, PredicateFormula) and fact.predicate is Equal:
+            self._merge(fact, self.context.facts.depth)
+
+    def context_closed(self, depth):
+        log = self._log
+        while log and log[-1][0] > depth:
+            _level, table, key, value = log.pop()
+            if value is _MISSING:
+                del table[key]
+            else:
+                table[key] = value
+
+    def find(self, term):
+        parent = self._parent
+        while term in parent:
+            term = parent[term]
+        return term
+
+    def equal(self, s, t):
+        return s is t or self.find(s) is self.find(t)
+
+    def _merge(self, identity, level):
+        x, y = identity.terms
+        rx, ry = self.find(x), self.find(y)
+        if rx is ry:
+            return
+        self._reroot(x, level)
+        self._set(self._proof, x, (y, identity), level)
+        sx, sy = self._size.get(rx, 1), self._size.get(ry, 1)
+        if sx < sy:
+            rx, ry = ry, rx
+        self._set(self._parent, ry, rx, level)
+        self._set(self._size, rx, sx + sy, level)
+
+    def _path(self, term):
+        '''the proof forest edges (identity, from, to) from term to its root'''
+        path = []
+        while term in self._proof:
+            following, identity = self._proof[term]
+            path.append((identity, term, following))
+            term = following
+        return path
+
+    def _reroot(self, term, level):
+        for identity, node, following in self._path(term):
+            self._set(self._proof, following, (node, identity), level)
+
+    def explain(self, s, t):
+        '''the Equal facts leading from s to t, as steps (identity, from, to)'''
+        assert self.equal(s, t)
+        if s is t:
+            return []
+        from_s = self._path(s)
+        from_t = self._path(t)
+        ancestors = {t}
+        ancestors.update(following for _, _, following in from_t)
+        steps = []
+        node = s
+        for identity, node_, following in from_s:
+            if node in ancestors:
+                break
+            steps.append((identity, node_, following))
+            node = following
+        back = []
+        for identity, node_, following in from_t:
+            if node_ is node:
+                break
+            back.append((identity, following, node_))
+        return steps + back[::-1]
+
+    def congruent(self, formula, other):
+        '''formula and other are equal modulo the known equalities'''
+        return (same_shape(formula, other) and
+                all(self.equal(s, t) for s, t in zip(terms(formula), terms(other))))
+
+    def rewrite(self, formula, target):
+        '''derive target from the fact formula by verified substitute_equal steps'''
+        assert self.congruent(formula, target)
+        p = self.context
+        current = terms(formula)
+        for i, t in enumerate(terms(target)):
+            for identity, _, following in self.explain(current[i], t):
+                current[i] = following
+                new_formula = rebuild(target, current)
+                if new_formula not in p.facts:
+                    p.substitute_equal(formula, new_formula, identity)
+                formula = new_formula
+        return formula
@@ -1,5 +1,7 @@
+import os
 from itertools import count
-from heapq import heappop, heappush, heapify
+from heapq import heappop, heappush
+from weakref import WeakValueDictionary
 
 SRC_HINT = object()
 SRC_GENERATOR = object()
@@ -28,73 +30,180 @@ class SymbolMap(dict):
 
 symbol_map = [SymbolMap()]
 
+# Every term owns a bit for the bitsets of OrderedFrozenSet. The bits of
+# collected terms are reused, lowest first. There are only WIDTH bits to
+# own: while they are all taken, new terms share the OVERFLOW bit, which
+# sets holding such terms resolve by scanning their items, so that a
+# bitset never grows wider than WIDTH + 1 bits however many terms are alive.
+WIDTH = 256
+OVERFLOW = 1 << WIDTH
+_bit_numbers = iter(range(WIDTH))
+_free_bit_numbers = []
+
+def _new_bit():
+    if _free_bit_numbers:
+        return 1 << heappop(_free_bit_numbers)
+    number = next(_bit_numbers, None)
+    return OVERFLOW if number is None else 1 << number
+
 class Term(object):
+    __slots__ = ('bit',)
+
     def __str__(self):
         return symbol_map[-1][self]
 
+    def __new__(cls, *args):
+        term = object.__new__(cls)
+        term.bit = _new_bit()
+        return term
+
+    def __del__(self):
+        if self.bit != OVERFLOW:
+            heappush(_free_bit_numbers, self.bit.bit_length() - 1)
+
+_object_bits = {}
+
+def term_bit(x):
+    '''the bit of a term; other objects used as variables, like numbers,
+    get a bit for good'''
+    try:
+        return x.bit
+    except AttributeError:
+        bit = _object_bits.get(x)
+        if bit is None:
+            bit = _object_bits[x] = _new_bit()
+        return bit
+
 
 class FreeTerm(Term):
+    __slots__ = ('hint', 'ctx', 'name')
+
     def __init__(self, ctx, hint=None):
         self.hint = hint
         self.ctx = ctx
+        self.name = None
         
     def __str__(self):
         return self.ctx.get_name(self, self.hint)
 
+# the name of a free term whose name has been given back to its context
+DISCARDED = object()
+
 class TermContext(object):
+    '''names of free terms, given when a term is first printed.
+
+    A term is named after its hint if that name is not in use, and otherwise
+    by the lowest generated name given back by a discarded term, or a new
+    one. The names given back are kept in a heap with lazy deletion: a
+    name taken by a hint stays in the heap until it surfaces, so that both
+    ways of reusing a name take logarithmic time.
+    '''
     def __init__(self):
-        self._names = {}
         self._used_names = {}
         self._free_names = []
+        self._free = set()
         self._gen_names = iter(free_term_symbols())
-        self._discarded = set()
         
     def get_name(self, var, hint=None):
-        if var in self._discarded:
+        name = var.name
+        if name is DISCARDED:
             raise ValueError('reusing discarded variable')
-        if var not in self._names:
+        if name is None:
             if hint and hint not in self._used_names:
-                if hint in self._free_names:
-                    self._free_names.remove(hint)
-                    heapify(self._free_names)
+                self._free.discard(hint)
                 name = hint
                 src = SRC_HINT
-            elif self._free_names:
+            elif self._free:
                 name = heappop(self._free_names)
+                while name not in self._free:
+                    name = heappop(self._free_names)
+                self._free.remove(name)
                 src = SRC_GENERATOR
             else:
                 name = next(self._gen_names)
-                while name in self._names:
+                while name in self._used_names:
                     name = next(self._gen_names)
                 src = SRC_GENERATOR
             assert name not in self._used_names
-            self._names[var] = name
+            var.name = name
             self._used_names[name] = src
-        return self._names[var]
+        return name
     
     def discard(self, var):
-        if var in self._discarded:
+        name = var.name
+        if name is DISCARDED:
             raise ValueError('cannot discard again')
-        if var in self._names:
-            name = self._names[var]
-            self._discarded.add(var)
+        if name is not None:
+            var.name = DISCARDED
             src = self._used_names.pop(name)
             if src is SRC_GENERATOR:
-                heappush(self._free_names, self._names[var])
-            del self._names[var]
+                self._free.add(name)
+                heappush(self._free_names, name)
+                if len(self._free_names) > 2 * len(self._free) + 16:
+                    self._free_names = sorted(self._free)
             
 
 '''first order logic formulas'''
 
 class BoundTerm(Term):
+    __slots__ = ('quantifier',)
+
     def __init__(self, quantifier):
         self.quantifier = quantifier
 
-class Formula(object):
+# Hash consing: while enabled every formula node is looked up in a weak table
+# after construction and alpha-equivalent nodes are replaced by one canonical
+# instance, so that equality of canonical nodes is an identity check.
+HASH_CONSING = True
+_canonical = WeakValueDictionary()
+
+class HashConsing(type):
+    def __call__(cls, *args):
+        formula = type.__call__(cls, *args)
+        formula._canonical = False
+        formula._key = None
+        if not HASH_CONSING:
+            return formula
+        canonical = _canonical.setdefault(formula.key(), formula)
+        canonical._canonical = True
+        return canonical
+
+class Formula(object, metaclass=HashConsing):
+    # the key and hash are cached on first use, free and bound variables are
+    # set by the constructors
+    __slots__ = ('_key', '_hash', '_canonical', '_free', '_bound', '__weakref__')
+
+    def free(self):
+        return self._free
+
+    def bound(self):
+        return self._bound
+
+    def key(self):
+        '''identifies the formula up to alpha-equivalence'''
+        if self._key is None:
+            self._key = self._make_key()
+            self._hash = hash(self._key)
+        return self._key
+
+    def _make_key(self):
+        return ('Q', self.free(), self.serialize())
+
     def substitute(self, subs):
-        subs = {x:t for x,t in subs.items() if x in self.free()}
-        assert not any(t in self.bound() for x,t in subs.items())
-        return self._substitute(subs)
+        mask = 0
+        for x in subs:
+            mask |= term_bit(x)
+        if not mask & self._free.mask:
+            return self
+        assert not any(t in self.bound() for x,t in subs.items() if x in self._free)
+        return self._substitute(subs, mask)
+
+    def _share(self, subs, mask):
+        '''the substituted subformula, or the subformula itself if none of the
+        variables with bits in mask is free in it'''
+        if not mask & self._free.mask:
+            return self
+        return self._substitute(subs, mask)
 
     def serialize(self):
         free = list(self.free())
@@ -116,10 +225,15 @@ class Formula(object):
         return self._string(names)
 
     def __eq__(self, other):
-        return self.free()==other.free() and self.serialize() == other.serialize()
+        if self is other:
+            return True
+        if self._canonical and other._canonical:
+            return False
+        return self.key() == other.key()
 
     def __hash__(self):
-        return hash(self.serialize())
+        self.key()
+        return self._hash
 
     def __and__(self, other):
         return BinaryConnective(self, '&', other)
@@ -143,29 +257,108 @@ class Predicate(object):
         assert len(args) == self.arity
         return PredicateFormula(self, *args)
 
-class OrderedFrozenSet(tuple):
-    def __new__(cls, items=()):
+class OrderedFrozenSet(object):
+    '''terms in the order they were first added, with the bits of the terms
+    or-ed into mask for constant time membership, union and difference;
+    the terms sharing the OVERFLOW bit are compared by scanning the items'''
+    __slots__ = ('items', 'mask')
+
+    def __init__(self, items=()):
         filtered = []
+        mask = 0
         for x in items:
-            if x in filtered:
-                continue
-            filtered.append(x)
-        return tuple.__new__(cls, filtered)
+            bit = term_bit(x)
+            if not bit & mask or bit == OVERFLOW and x not in filtered:
+                mask |= bit
+                filtered.append(x)
+        self.items = tuple(filtered)
+        self.mask = mask
+
+    @classmethod
+    def _make(cls, items, mask):
+        result = object.__new__(cls)
+        result.items = items
+        result.mask = mask
+        return result
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, x):
+        bit = term_bit(x)
+        if bit == OVERFLOW:
+            return bit & self.mask != 0 and x in self.items
+        return bit & self.mask != 0
+
+    def __eq__(self, other):
+        if not isinstance(other, OrderedFrozenSet):
+            return NotImplemented
+        return self.items == other.items
+
+    def __hash__(self):
+        return hash(self.items)
+
+    def __repr__(self):
+        return 'OrderedFrozenSet(%r)' % (self.items,)
+
+    def _filter(self, keep):
+        items = tuple(x for x in self.items if keep(x))
+        if len(items) == len(self.items):
+            return self
+        return OrderedFrozenSet(items)
 
     def __and__(self, other):
-        return OrderedFrozenSet([x for x in self if x in other])
+        other = as_set(other)
+        mask = self.mask & other.mask
+        if mask & OVERFLOW:
+            return self._filter(other.__contains__)
+        if mask == self.mask:
+            return self
+        return self._make(tuple(x for x in self.items if term_bit(x) & mask), mask)
 
     def __or__(self, other):
-        return OrderedFrozenSet(self + other)
+        other = as_set(other)
+        if self.mask & other.mask & OVERFLOW:
+            added = tuple(x for x in other.items if x not in self)
+            if not added:
+                return self
+            return self._make(self.items + added, self.mask | other.mask)
+        if not other.mask & ~self.mask:
+            return self
+        if not self.mask:
+            return other
+        added = tuple(x for x in other.items if not term_bit(x) & self.mask)
+        return self._make(self.items + added, self.mask | other.mask)
 
     def __sub__(self, other):
-        return OrderedFrozenSet([x for x in self if x not in other])
-    
+        other = as_set(other)
+        if self.mask & other.mask & OVERFLOW:
+            return self._filter(lambda x: x not in other)
+        mask = self.mask & ~other.mask
+        if mask == self.mask:
+            return self
+        return self._make(tuple(x for x in self.items if term_bit(x) & mask), mask)
+
+def as_set(terms):
+    if isinstance(terms, OrderedFrozenSet):
+        return terms
+    return OrderedFrozenSet(terms)
+
 
 class PredicateFormula(Formula):
+    __slots__ = ('predicate', 'terms')
+
     def __init__(self, predicate, *terms):
         self.predicate = predicate
         self.terms = terms
+        self._free = OrderedFrozenSet(terms)
+        self._bound = OrderedFrozenSet()
+
+    def _make_key(self):
+        return ('Pred', self.predicate, self.terms)
 
     def _string(self, names):
         return self.predicate.fmt.format(*(names[x] for x in self.terms))
@@ -173,21 +366,22 @@ class PredicateFormula(Formula):
     def __repr__(self):
         return '%s(%s)' % (self.predicate.name, ', '.join(map(repr, self.terms)))
 
-    def free(self):
-        return OrderedFrozenSet(self.terms)
-
-    def bound(self):
-        return OrderedFrozenSet()
-
-    def _substitute(self, subs):
+    def _substitute(self, subs, mask):
         return PredicateFormula(self.predicate, *tuple(subs.get(x,x) for x in self.terms))
 
     def _serialize(self, varids):
-        return ('Pred', self.predicate.name, tuple(varids[x] for x in self.terms))
+        return ('Pred', self.predicate.name, tuple(varids.get(x, x) for x in self.terms))
 
 class Negation(Formula):
+    __slots__ = ('formula',)
+
     def __init__(self, formula):
         self.formula = formula
+        self._free = formula.free()
+        self._bound = formula.bound()
+
+    def _make_key(self):
+        return ('Neg', self.formula)
 
     def _string(self, names):
         return '!%s' % (self.formula._string(names),)
@@ -195,23 +389,24 @@ class Negation(Formula):
     def __repr__(self):
         return 'Negation(%r)' % (self.formula,)
 
-    def free(self):
-        return self.formula.free()
-
-    def bound(self):
-        return self.formula.bound()
-
-    def _substitute(self, subs):
-        return Negation(self.formula.substitute(subs))
+    def _substitute(self, subs, mask):
+        return Negation(self.formula._share(subs, mask))
 
     def _serialize(self, varids):
         return ('Neg', self.formula._serialize(varids))
 
 class BinaryConnective(Formula):
+    __slots__ = ('left', 'connective', 'right')
+
     def __init__(self, left, connective, right):
         self.left = left
         self.connective = connective
         self.right = right
+        self._free = left.free() | right.free()
+        self._bound = left.bound() | right.bound()
+
+    def _make_key(self):
+        return ('Bin', self.connective, self.left, self.right)
 
     def _string(self, names):
         return '(%s %s %s)' % (self.left._string(names), self.connective, self.right._string(names))
@@ -219,23 +414,25 @@ class BinaryConnective(Formula):
     def __repr__(self):
         return '(%r %s %r)' % (self.left, self.connective, self.right)
 
-    def free(self):
-        return self.left.free() | self.right.free()
-
-    def bound(self):
-        return self.left.bound() | self.right.bound()
-        
-    def _substitute(self, subs):
-        return BinaryConnective(self.left.substitute(subs), self.connective, self.right.substitute(subs))
+    def _substitute(self, subs, mask):
+        return BinaryConnective(self.left._share(subs, mask), self.connective, self.right._share(subs, mask))
 
     def _serialize(self, varids):
         return ('Bin', self.connective, self.left._serialize(varids), self.right._serialize(varids))
 
 class UniversalQuantifier(Formula):
-    def __init__(self, terms, formula):
-        subs = {t:BoundTerm(self) for t in terms}
-        self.terms = tuple(subs[t] for t in terms)
-        self.formula = formula.substitute(subs)
+    __slots__ = ('terms', 'formula')
+    tag = 'Uni'
+
+    def __init__(self, terms, formula, subs=None):
+        # subs is substituted in formula together with the bound variables
+        bound = {t:BoundTerm(self) for t in terms}
+        self.terms = tuple(bound[t] for t in terms)
+        if subs:
+            bound = {**subs, **bound}
+        self.formula = formula.substitute(bound)
+        self._free = self.formula.free() - self.terms
+        self._bound = self.formula.bound() | self.terms
 
     def _string(self, names):
         for b in self.terms:
@@ -248,35 +445,45 @@ class UniversalQuantifier(Formula):
     def __repr__(self):
         return 'UniversalQuantifier((%s), %r)' % (','.join(map(repr,self.terms)), self.formula)
 
-    def free(self):
-        return self.formula.free() - self.terms
-
-    def bound(self):
-        return self.formula.bound() | self.terms
-
-    def _substitute(self, subs):
-        return UniversalQuantifier(self.terms, self.formula.substitute(subs))
+    def _substitute(self, subs, mask):
+        return type(self)(self.terms, self.formula, subs)
 
     def _serialize(self, varids):
-        return ('Uni', tuple(varids[x] for x in self.terms), self.formula._serialize(varids))
+        return (self.tag, tuple(varids[x] for x in self.terms), self.formula._serialize(varids))
+
+    def open(self, terms):
+        return self.formula.substitute(dict(zip(self.terms, terms)))
 
     def specialise(self, index, freevar):
         assert freevar not in self.bound()
         formula = self.formula.substitute({self.terms[index]:freevar})
-
-        result = UniversalQuantifier(self.terms[:index] + self.terms[index+1:], formula)
-        str(result)
-        
         if len(self.terms) > 1:
-            return result
+            return type(self)(self.terms[:index] + self.terms[index+1:], formula)
         else:
             return formula
-        
+
+    def specialise_terms(self, terms):
+        '''the formula with its first len(terms) variables replaced by terms,
+        substituted in a single traversal of the body'''
+        assert not any(t in self.bound() for t in terms)
+        formula = self.formula.substitute(dict(zip(self.terms, terms)))
+        if len(terms) < len(self.terms):
+            return type(self)(self.terms[len(terms):], formula)
+        return formula
+
 class ExistentialQuantifier(Formula):
-    def __init__(self, terms, formula):
-        subs = {t:BoundTerm(self) for t in terms}
-        self.terms = tuple(subs[t] for t in terms)
-        self.formula = formula.substitute(subs)
+    __slots__ = ('terms', 'formula')
+    tag = 'Ex'
+
+    def __init__(self, terms, formula, subs=None):
+        # subs is substituted in formula together with the bound variables
+        bound = {t:BoundTerm(self) for t in terms}
+        self.terms = tuple(bound[t] for t in terms)
+        if subs:
+            bound = {**subs, **bound}
+        self.formula = formula.substitute(bound)
+        self._free = self.formula.free() - self.terms
+        self._bound = self.formula.bound() | self.terms
 
     def _string(self, names):
         for b in self.terms:
@@ -289,14 +496,104 @@ class ExistentialQuantifier(Formula):
     def __repr__(self):
         return 'ExistentialQuantifier((%s), %r)' % (','.join(map(repr,self.terms)), self.formula)
 
-    def free(self):
-        return self.formula.free() - self.terms
+    def _substitute(self, subs, mask):
+        return type(self)(self.terms, self.formula, subs)
 
-    def bound(self):
-        return self.formula.bound() | self.terms
+    def _serialize(self, varids):
+        return (self.tag, tuple(varids[x] for x in self.terms), self.formula._serialize(varids))
+
+    def open(self, terms):
+        return self.formula.substitute(dict(zip(self.terms, terms)))
+
+
+'''nameless representation of quantifiers using de Bruijn indices'''
+
+class BoundIndex(Term):
+    '''the index-th variable of the quantifier depth levels further out'''
+    __slots__ = ('depth', 'index')
+    _instances = {}
+
+    def __new__(cls, depth, index):
+        try:
+            return cls._instances[depth, index]
+        except KeyError:
+            term = cls._instances[depth, index] = Term.__new__(cls)
+            term.depth = depth
+            term.index = index
+            return term
+
+    def __repr__(self):
+        return '#%d.%d' % (self.depth, self.index)
+
+def shifted(term, levels=1):
+    if isinstance(term, BoundIndex):
+        return BoundIndex(term.depth + levels, term.index)
+    return term
+
+class NamelessQuantifier(Formula):
+    __slots__ = ('terms', 'formula')
+
+    def __init__(self, terms, formula):
+        self.terms = tuple(BoundIndex(0, i) for i in range(len(terms)))
+        subs = {t:b for t,b in zip(terms, self.terms) if t is not b}
+        self.formula = formula.substitute(subs) if subs else formula
+        self._free = OrderedFrozenSet(shifted(x, -1) for x in self.formula.free()
+                                      if not (isinstance(x, BoundIndex) and x.depth == 0))
+        self._bound = OrderedFrozenSet()
+
+    def _make_key(self):
+        return (self.tag, len(self.terms), self.formula)
+
+    def _string(self, names):
+        new_names = (t for t in bound_term_symbols() if t not in names.values())
+        own_names = [next(new_names) for _ in self.terms]
+        new_names_map = {shifted(x):n for x,n in names.items()}
+        new_names_map.update(zip(self.terms, own_names))
+        return '%s%s: %s' % (self.symbol, ','.join(own_names), self.formula._string(new_names_map))
 
-    def _substitute(self, subs):
-        return ExistentialQuantifier(self.terms, self.formula.substitute(subs))
+    def __repr__(self):
+        return '%s(%d, %r)' % (type(self).__name__, len(self.terms), self.formula)
+
+    def _substitute(self, subs, mask):
+        return type(self)(self.terms, self.formula.substitute({shifted(x):shifted(t) for x,t in subs.items()}))
 
     def _serialize(self, varids):
-        return ('Ex', tuple(varids[x] for x in self.terms), self.formula._serialize(varids))
+        return (self.tag, len(self.terms), self.formula._serialize(varids))
+
+    def open(self, terms):
+        subs = dict(zip(self.terms, terms))
+        subs.update((x, shifted(x, -1)) for x in self.formula.free()
+                    if isinstance(x, BoundIndex) and x.depth > 0)
+        return self.formula.substitute(subs)
+
+class NamelessUniversalQuantifier(NamelessQuantifier):
+    symbol = 'A'
+    tag = 'Uni'
+
+    def specialise(self, index, freevar):
+        if len(self.terms) == 1:
+            return self.open((freevar,))
+        subs = {self.terms[index]: freevar}
+        subs.update((b, BoundIndex(0, i-1)) for i,b in enumerate(self.terms) if i > index)
+        return type(self)(self.terms[:-1], self.formula.substitute(subs))
+
+    def specialise_terms(self, terms):
+        '''the formula with its first len(terms) variables replaced by terms,
+        substituted in a single traversal of the body'''
+        n = len(terms)
+        if n == len(self.terms):
+            return self.open(terms)
+        subs = dict(zip(self.terms, terms))
+        subs.update((b, BoundIndex(0, i-n)) for i,b in enumerate(self.terms) if i >= n)
+        return type(self)(self.terms[n:], self.formula.substitute(subs))
+
+class NamelessExistentialQuantifier(NamelessQuantifier):
+    symbol = 'E'
+    tag = 'Ex'
+
+# TARSKI_FORMULA=debruijn selects the nameless representation for all
+# quantifiers created through UniversalQuantifier and ExistentialQuantifier.
+REPRESENTATION = os.environ.get('TARSKI_FORMULA', 'named')
+if REPRESENTATION == 'debruijn':
+    UniversalQuantifier = NamelessUniversalQuantifier
+    ExistentialQuantifier = NamelessExistentialQuantifier
@@ -0,0 +1,156 @@
+'''path index of the universally quantified facts of a ProofContext
+
+Every universal fact in scope is filed under the shape of its head, the
+consequent of its body if the body is an implication and the body
+otherwise, and under the shapes of the atoms of its antecedent. A shape is
+the formula with its terms left out. Within a shape the facts are grouped
+by the terms along the leaves of the head: each variable is numbered by
+its first occurrence and the other terms are kept. Groups with such a
+constant term are filed under the position and term of the first one. A
+query looks up the shape of the goal and tests only the groups without
+constants and those filed under a leaf of the goal, so its cost depends
+on the variety of the variable patterns and not on the number of facts.
+
+Terms under a nested quantifier are not part of the paths, so the
+candidates are generalisations up to those, to be confirmed by matching.
+'''
+from itertools import count
+from formula import (PredicateFormula, Negation, BinaryConnective,
+                     UniversalQuantifier)
+from match import atoms
+
+
+def shape(formula):
+    '''the formula without its terms, as a nested tuple'''
+    if isinstance(formula, PredicateFormula):
+        return formula.predicate
+    if isinstance(formula, Negation):
+        return ('!', shape(formula.formula))
+    if isinstance(formula, BinaryConnective):
+        return (formula.connective, shape(formula.left), shape(formula.right))
+    return (formula.tag, len(formula.terms), shape(formula.formula))
+
+
+def leaves(formula, terms=None):
+    '''the terms of formula outside of nested quantifiers, left to right'''
+    if terms is None:
+        terms = []
+    if isinstance(formula, PredicateFormula):
+        terms.extend(formula.terms)
+    elif isinstance(formula, Negation):
+        leaves(formula.formula, terms)
+    elif isinstance(formula, BinaryConnective):
+        leaves(formula.left, terms)
+        leaves(formula.right, terms)
+    return terms
+
+
+def path_key(formula, variables):
+    '''the leaves of formula, with the variables numbered by first occurrence'''
+    numbers = {}
+    return tuple(numbers.setdefault(t, len(numbers)) if t in variables else t
+                 for t in leaves(formula))
+
+
+def anchor(key):
+    '''the position and term of the first constant of a path key, or None'''
+    for i, k in enumerate(key):
+        if not isinstance(k, int):
+            return (i, k)
+    return None
+
+
+def admits(key, terms):
+    '''whether a path key generalises the leaves terms'''
+    bound = {}
+    for k, term in zip(key, terms):
+        if isinstance(k, int):
+            if bound.setdefault(k, term) is not term:
+                return False
+        elif k is not term:
+            return False
+    return True
+
+
+class TheoremIndex(object):
+    '''the universal facts of a context, indexed by heads and antecedent atoms.
+
+    The index listens to the context, so facts are filed as they are added
+    and dropped when their scope is closed.
+    '''
+    def __init__(self, context):
+        self.context = context
+        self._heads = {}
+        self._atoms = {}
+        self._serial = count()
+        # the entries filed at each depth, to drop them when it is closed
+        self._levels = [[]]
+        for fact in list(context.facts):
+            self._file(fact, context.facts.level(fact))
+        context.listeners.append(self)
+
+    def close(self):
+        self.context.listeners.remove(self)
+
+    def __len__(self):
+        return len({fact for anchors in self._heads.values() for groups in anchors.values()
+                    for facts in groups.values() for fact in facts})
+
+    def _file(self, fact, level):
+        if not isinstance(fact, UniversalQuantifier):
+            return
+        while len(self._levels) <= level:
+            self._levels.append([])
+        variables = set(fact.terms)
+        body = fact.formula
+        if isinstance(body, BinaryConnective) and body.connective == '->':
+            head = body.right
+            for atom in atoms(body.left):
+                self._insert(self._atoms, shape(atom), path_key(atom, variables), fact, level)
+        else:
+            head = body
+        self._insert(self._heads, shape(head), path_key(head, variables), fact, level)
+
+    def _insert(self, table, shape, key, fact, level):
+        groups = table.setdefault(shape, {}).setdefault(anchor(key), {})
+        groups.setdefault(key, {})[fact] = next(self._serial)
+        self._levels[level].append((table, shape, key, fact))
+
+    def fact_added(self, fact):
+        self._file(fact, self.context.facts.depth)
+
+    def context_closed(self, depth):
+        while len(self._levels) > depth + 1:
+            for table, shape, key, fact in self._levels.pop():
+                anchors = table.get(shape, {})
+                groups = anchors.get(anchor(key), {})
+                facts = groups.get(key, {})
+                facts.pop(fact, None)
+                if not facts:
+                    groups.pop(key, None)
+                if not groups:
+                    anchors.pop(anchor(key), None)
+                if not anchors:
+                    table.pop(shape, None)
+
+    def _lookup(self, table, formula):
+        anchors = table.get(shape(formula))
+        if not anchors:
+            return []
+        terms = leaves(formula)
+        found = {}
+        for a in [None] + list(enumerate(terms)):
+            for key, facts in anchors.get(a, {}).items():
+                if admits(key, terms):
+                    found.update(facts)
+        return sorted(found, key=found.get)
+
+    def generalisations(self, goal):
+        '''the universal facts whose head may be specialised to goal, in the
+        order they were added'''
+        return self._lookup(self._heads, goal)
+
+    def triggers(self, atom):
+        '''the universal facts with an atom of the antecedent that may be
+        specialised to atom'''
+        return self._lookup(self._atoms, atom)
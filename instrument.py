@@ -0,0 +1,212 @@
+'''per rule and per theorem statistics of a ProofContext
+
+A Profile attached to a context wraps the rules of the context and the
+methods of its log; a context without a profile runs unchanged. For every
+theorem and rule it counts the calls, the time spent in the rule including
+and excluding the rules it calls, the facts added and their sizes in
+formula nodes, the hash and equality computations of formulas, and the
+deepest scope the rule was used in. Lookups in the FactStore do not depend
+on the nesting of the scopes, so the scope depth is reported in place of a
+lookup depth.
+
+The statistics are exported as json, and the time spent in each stack of
+theorem and nested rules as folded stacks, one 'frame;frame microseconds'
+line per stack, as read by flame graph tools.
+
+usage: python instrument.py [table|json|folded]
+'''
+import json
+import sys
+import time
+from collections import Counter
+from formula import Formula, PredicateFormula, BinaryConnective
+
+RULES = [
+    'recall', 'assume', 'start_context', 'start_context_names', 'directproof',
+    'abandon', 'disjunction_elimination', 'tertium_non_datur', 'non_contradiction',
+    'specialise', 'instantiate', 'generalize', 'conjunction', 'deduce_left',
+    'deduce_right', 'deduce_all', 'substitute_equal', 'modus_ponens',
+    'modus_ponens2', 'modus_tollens', 'auto_conjunction', 'find', 'prove',
+    'specialise_to', 'apply', 'tautology',
+]
+
+FIELDS = ['calls', 'time', 'self', 'facts', 'nodes', 'hashes', 'equalities', 'depth']
+
+
+def size(formula):
+    '''the number of nodes of formula'''
+    if isinstance(formula, PredicateFormula):
+        return 1
+    if isinstance(formula, BinaryConnective):
+        return 1 + size(formula.left) + size(formula.right)
+    return 1 + size(formula.formula)
+
+
+class Frame(object):
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.children = 0.0
+        self.counts = Counter()
+
+
+class Profile(object):
+    '''statistics of the rules applied in context until close is called.
+
+    With formulas set, the hash and equality computations of all formulas
+    are counted too, which slows every formula operation down while the
+    profile is attached.
+    '''
+    def __init__(self, context, formulas=True):
+        self.context = context
+        self.log = context.log
+        self.formulas = formulas
+        self.stats = {}
+        self.stacks = Counter()
+        self._stack = [Frame(None)]
+        self._saved = []
+        self._forward = {name: getattr(self.log, name) for name in ('fact', 'theorem', 'qed')}
+        for name in RULES:
+            self._wrap(context, name, self._profiled(name, getattr(context, name)))
+        for name in ('fact', 'theorem', 'qed'):
+            self._wrap(self.log, name, getattr(self, '_' + name))
+        if formulas:
+            self._eq = Formula.__eq__
+            self._hash = Formula.__hash__
+            Formula.__eq__ = self._counted('equalities', self._eq)
+            Formula.__hash__ = self._counted('hashes', self._hash)
+
+    def _wrap(self, obj, name, wrapper):
+        self._saved.append((obj, name, obj.__dict__.get(name)))
+        setattr(obj, name, wrapper)
+
+    def close(self):
+        '''detach from the context'''
+        for obj, name, saved in reversed(self._saved):
+            if saved is None:
+                del obj.__dict__[name]
+            else:
+                setattr(obj, name, saved)
+        if self.formulas:
+            Formula.__eq__ = self._eq
+            Formula.__hash__ = self._hash
+
+    def _counted(self, field, method):
+        stack = self._stack
+
+        def counted(*args):
+            stack[-1].counts[field] += 1
+            return method(*args)
+        return counted
+
+    def _profiled(self, name, rule):
+        def profiled(*args, **kwargs):
+            self._enter(name)
+            try:
+                return rule(*args, **kwargs)
+            finally:
+                self._exit()
+        return profiled
+
+    def _enter(self, name):
+        frame = Frame(name)
+        frame.counts['depth'] = self.context.facts.depth
+        self._stack.append(frame)
+
+    def _exit(self):
+        frame = self._stack.pop()
+        elapsed = time.perf_counter() - frame.start
+        self._stack[-1].children += elapsed
+        names = [f.name for f in self._stack[1:]] + [frame.name]
+        self._record(names, elapsed, frame)
+
+    def _record(self, names, elapsed, frame):
+        theorem = self._stack[0].name
+        stats = self.stats.setdefault((theorem, names[-1]), dict.fromkeys(FIELDS, 0))
+        stats['calls'] += 1
+        stats['time'] += elapsed
+        stats['self'] += elapsed - frame.children
+        for field, n in frame.counts.items():
+            if field == 'depth':
+                stats['depth'] = max(stats['depth'], n)
+            else:
+                stats[field] += n
+        stack = ';'.join([theorem or '(context)'] + names)
+        self.stacks[stack] += int((elapsed - frame.children) * 1e6)
+
+    # wrappers of the methods of the log; the time and counts of a theorem
+    # outside of the rules are recorded as its rule '(proof)'
+
+    def _fact(self, number, fact, justification, references, depth):
+        counts = self._stack[-1].counts
+        counts['facts'] += 1
+        counts['nodes'] += size(fact)
+        self._forward['fact'](number, fact, justification, references, depth)
+
+    def _theorem(self, name, doc, statement):
+        self._stack[0] = Frame(name)
+        self._forward['theorem'](name, doc, statement)
+
+    def _qed(self, name):
+        frame = self._stack[0]
+        self._record(['(proof)'], time.perf_counter() - frame.start, frame)
+        self._stack[0] = Frame(None)
+        self._forward['qed'](name)
+
+    # exports
+
+    def totals(self):
+        '''the statistics per rule, summed over the theorems'''
+        totals = {}
+        for (theorem, rule), stats in self.stats.items():
+            total = totals.setdefault(rule, dict.fromkeys(FIELDS, 0))
+            for field, n in stats.items():
+                total[field] = max(total[field], n) if field == 'depth' else total[field] + n
+        return totals
+
+    def to_json(self):
+        return {
+            'rules': self.totals(),
+            'theorems': [dict(stats, theorem=theorem, rule=rule)
+                         for (theorem, rule), stats in self.stats.items()],
+        }
+
+    def write_json(self, file):
+        json.dump(self.to_json(), file, indent=1)
+
+    def write_folded(self, file):
+        for stack, microseconds in sorted(self.stacks.items()):
+            if microseconds:
+                file.write('%s %d\n' % (stack, microseconds))
+
+    def write_table(self, file):
+        file.write('%-24s' % 'rule' + ''.join('%11s' % f for f in FIELDS) + '\n')
+        for rule, stats in sorted(self.totals().items(), key=lambda item: -item[1]['self']):
+            file.write('%-24s' % rule + ''.join(
+                '%11.4f' % stats[f] if isinstance(stats[f], float) else '%11d' % stats[f]
+                for f in FIELDS) + '\n')
+
+
+def profile_library():
+    '''profile the verification of the whole library of main.py'''
+    from parallel import load
+    from log import SilentLog
+    from proof import ProofContext
+    from tarski import axioms, equality_axioms
+    lib = load()
+    lib.cache = None
+    p = lib.namespace['p'] = ProofContext(axioms+equality_axioms, log=SilentLog())
+    profile = Profile(p)
+    try:
+        lib.verify_all()
+    finally:
+        profile.close()
+    return profile
+
+
+if __name__ == '__main__':
+    output = sys.argv[1] if len(sys.argv) > 1 else 'table'
+    profile = profile_library()
+    {'table': profile.write_table,
+     'json': profile.write_json,
+     'folded': profile.write_folded}[output](sys.stdout)
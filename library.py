@@ -0,0 +1,186 @@
+'''registry of the theorems of a proof library
+
+A module declares its theorems with the theorem decorator of a Library. The
+proofs refer to the ProofContext they are verified in as the global p of
+that module, and to earlier theorems by their names.
+
+Declaring a theorem only registers its statement. A proof is run when the
+theorem is verified, by verify or verify_all, after the theorems it refers
+to have been verified.
+'''
+import atexit
+import functools
+import hashlib
+import inspect
+import json
+import os
+import types
+
+# theorems declared while EAGER is set are verified at once
+EAGER = False
+
+VERIFIER = ['formula.py', 'proof.py', 'search.py', 'match.py', 'index.py', 'sat.py', 'tarski.py', 'library.py']
+
+
+class Theorem(object):
+    def __init__(self, name, statement, proof):
+        self.name = name
+        self.statement = statement
+        self.proof = proof
+        self.doc = proof.__doc__.strip()
+        self.verified = False
+
+
+def code_names(code):
+    '''the global names used by a code object and the code nested in it'''
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= code_names(const)
+    return names
+
+
+@functools.lru_cache(None)
+def verifier_hash():
+    '''hash of the sources of the verifier'''
+    h = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for filename in VERIFIER:
+        with open(os.path.join(directory, filename), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class Cache(object):
+    '''theorems verified in earlier runs, stored as json in the file path.
+
+    Each entry holds the serialized statement and a key hashing everything
+    the verification depended on. With refresh the stored entries are
+    ignored, so that everything is verified again and stored anew. New
+    entries are written by flush, which runs at exit too.
+    '''
+    def __init__(self, path, refresh=False):
+        self.path = path
+        self.entries = {}
+        self._dirty = False
+        if not refresh and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+        atexit.register(self.flush)
+
+    def get(self, name, key):
+        entry = self.entries.get(name)
+        if entry is not None and entry['key'] == key:
+            return entry['statement']
+
+    def put(self, name, key, statement):
+        self.entries[name] = {'key': key, 'statement': statement}
+        self._dirty = True
+
+    def flush(self):
+        if not self._dirty:
+            return
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(self.path + '.tmp', self.path)
+        self._dirty = False
+
+
+class Library(object):
+    def __init__(self, namespace, cache=None):
+        self.namespace = namespace
+        self.cache = cache
+        self.theorems = {}
+        self._keys = {}
+
+    @property
+    def context(self):
+        return self.namespace['p']
+
+    def theorem(self, statement):
+        def verifyer(proof):
+            theorem = Theorem(proof.__name__, statement, proof)
+            self.theorems[theorem.name] = theorem
+            if EAGER:
+                self.verify(theorem.name)
+            return statement
+        return verifyer
+
+    def verify(self, name):
+        '''verify the theorem and, before it, the theorems its proof uses'''
+        theorem = self.theorems[name]
+        if not theorem.verified:
+            order = list(self.theorems)
+            for dependency in sorted(self.dependencies(name), key=order.index):
+                self.verify(dependency)
+            if self.cache is None:
+                self.check(theorem)
+            elif not self.load(theorem):
+                self.check(theorem)
+                self.cache.put(name, self.key(name), repr(theorem.statement.serialize()))
+        return theorem.statement
+
+    def verify_all(self):
+        for name in self.theorems:
+            self.verify(name)
+        if self.cache is not None:
+            self.cache.flush()
+
+    def load(self, theorem):
+        '''add the theorem to the context if the cache holds it under the current key'''
+        stored = self.cache.get(theorem.name, self.key(theorem.name))
+        if stored != repr(theorem.statement.serialize()):
+            return False
+        p = self.context
+        p.log.theorem(theorem.name, '(cached) ' + theorem.doc, theorem.statement)
+        p.recall(theorem.statement)
+        p.log.qed(theorem.name)
+        theorem.verified = True
+        return True
+
+    def key(self, name):
+        '''hash of the verifier, the statement, the sources of the proof and
+        the helper functions it uses, and the keys of its dependencies'''
+        if name not in self._keys:
+            theorem = self.theorems[name]
+            theorems, functions = self._references(name)
+            h = hashlib.sha256()
+            h.update(verifier_hash().encode())
+            h.update(repr(theorem.statement.serialize()).encode())
+            for function in [theorem.proof] + sorted(functions, key=lambda f: f.__name__):
+                h.update(inspect.getsource(function).encode())
+            for dependency in sorted(theorems):
+                h.update(self.key(dependency).encode())
+            self._keys[name] = h.hexdigest()
+        return self._keys[name]
+
+    def check(self, theorem):
+        '''run the proof of the theorem in the current context'''
+        p = self.context
+        p.log.theorem(theorem.name, theorem.doc, theorem.statement)
+        deduction = theorem.proof()
+        assert deduction == theorem.statement
+        p.log.qed(theorem.name)
+        theorem.verified = True
+        return deduction
+
+    def dependencies(self, name):
+        '''the earlier theorems used by the proof of the theorem, directly or
+        through the helper functions of the module'''
+        return self._references(name)[0]
+
+    def _references(self, name):
+        earlier = list(self.theorems)
+        earlier = set(earlier[:earlier.index(name)])
+        theorems = set()
+        functions = {}
+        pending = [self.theorems[name].proof]
+        while pending:
+            function = pending.pop()
+            for used in code_names(function.__code__):
+                if used in earlier:
+                    theorems.add(used)
+                elif used not in functions and isinstance(self.namespace.get(used), types.FunctionType):
+                    functions[used] = self.namespace[used]
+                    pending.append(functions[used])
+        return theorems, list(functions.values())
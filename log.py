@@ -0,0 +1,81 @@
+'''sinks receiving the facts derived by a ProofContext'''
+import json
+import sys
+
+QED = '                                                      #'
+
+
+class SilentLog(object):
+    '''discards everything, for batch verification'''
+    def fact(self, number, fact, justification, references, depth):
+        pass
+
+    def theorem(self, name, doc, statement):
+        pass
+
+    def qed(self, name):
+        pass
+
+    def close(self):
+        pass
+
+
+class TextLog(SilentLog):
+    '''human readable log, printing each fact as soon as it is derived'''
+    def __init__(self, file=None):
+        self.file = file
+
+    def fact(self, number, fact, justification, references, depth):
+        if not references:
+            ref = ''
+        else:
+            ref = '(%s)' % ', '.join(map(str, references))
+        print(number, '  '*depth, fact, justification, ref, file=self.file or sys.stdout)
+
+    def theorem(self, name, doc, statement):
+        file = self.file or sys.stdout
+        print(f'Theorem ({name}):  {doc}', file=file)
+        print(f'  {statement}\nProof:', file=file)
+
+    def qed(self, name):
+        print(QED, file=self.file or sys.stdout)
+
+
+class EventLog(SilentLog):
+    '''buffers structured events and writes them as json lines on close.
+
+    Formulas are only rendered to text if formulas is set, and then at the
+    time the fact is derived, while all its variables still have names.
+    '''
+    def __init__(self, file=None, formulas=False):
+        self.file = file
+        self.formulas = formulas
+        self.events = []
+
+    def fact(self, number, fact, justification, references, depth):
+        event = {'fact': number, 'rule': justification,
+                 'references': list(references), 'depth': depth}
+        if self.formulas:
+            event['formula'] = str(fact)
+        self.events.append(event)
+
+    def theorem(self, name, doc, statement):
+        event = {'theorem': name}
+        if self.formulas:
+            event['statement'] = str(statement)
+        self.events.append(event)
+
+    def qed(self, name):
+        self.events.append({'qed': name})
+
+    def close(self):
+        file = self.file or sys.stdout
+        file.writelines(json.dumps(event) + '\n' for event in self.events)
+        self.events = []
+
+
+LOGS = {
+    'text': TextLog,
+    'silent': SilentLog,
+    'events': EventLog,
+}
@@ -1,21 +1,24 @@
+import os
 from proof import ProofContext
 from tarski import axioms, Congruent, Equal, Between, equality_axioms
 from formula import (UniversalQuantifier as ForAll,
                      ExistentialQuantifier as Exists)
-
-QED = '                                                      #'
-
-def theorem(statement):
-    def verifyer(proof):
-        print(f'Theorem ({proof.__name__}):  {proof.__doc__.strip()}')
-        print(f'  {statement}\nProof:')
-        deduction = proof()
-        assert deduction == statement
-        print(QED)
-        return deduction
-    return verifyer
-
-p = ProofContext(axioms+equality_axioms)
+from log import LOGS
+from library import Library, Cache
+
+# verified theorems are cached in .tarski_cache.json unless TARSKI_CACHE is
+# off; with TARSKI_CACHE=refresh everything is verified again. Running
+# main.py checks every proof unless TARSKI_CACHE=on is given.
+cache = os.environ.get('TARSKI_CACHE', 'off' if __name__ == '__main__' else 'on')
+library = Library(globals(), None if cache == 'off' else Cache(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.tarski_cache.json'),
+    refresh=cache == 'refresh'))
+theorem = library.theorem
+
+# TARSKI_LOG selects how the derived facts are reported: text, silent or
+# events; by default they are only printed when main.py is run
+log = os.environ.get('TARSKI_LOG', 'text' if __name__ == '__main__' else 'silent')
+p = ProofContext(axioms+equality_axioms, log=LOGS[log]())
 
 @theorem(ForAll((1,2), Equal(1,2) > Equal(2,1)))
 def symmetry_equal():
@@ -103,20 +106,11 @@ def Thm_2_5_bis():
     X2 = p.modus_ponens(p.specialise(Thm_2_5, (b,a,c,d)))
     return p.directproof(X2)
 
-def show_congruent(p, a,b,c,d, try_reverse=True):
-    if Congruent(a,b,c,d) in p.facts:
-        return Congruent(a,b,c,d)
-    if a==c and b==d:
-        return p.modus_ponens(p.specialise(Thm_2_1, (a,b)))
-    if Congruent(b,a,c,d) in p.facts:
-        return p.modus_ponens(p.specialise(Thm_2_4, (b,a,c,d)))
-    if Congruent(a,b,d,c) in p.facts:
-        return p.modus_ponens(p.specialise(Thm_2_5, (a,b,d,c)))
-    if Congruent(b,a,d,c) in p.facts:
-        return p.modus_ponens(p.specialise(Thm_2_5_bis, (b,a,d,c)))
-    if try_reverse:
-        if show_congruent(p, c,d,a,b, False):
-            return p.modus_ponens(p.specialise(Thm_2_2, (c,d,a,b)))
+def show_congruent(goal):
+    """derive a congruence from one of its symmetric forms in scope"""
+    congruence = p.prove(goal, using=(Thm_2_1, Thm_2_2, Thm_2_4, Thm_2_5, Thm_2_5_bis))
+    assert congruence is not None, 'no proof of %s' % goal
+    return congruence
 
 @theorem(ForAll((1,2), Congruent(1,1,2,2)))
 def Thm_2_8():
@@ -178,8 +172,7 @@ def Thm_2_11():
     D4 = p.modus_ponens(p.specialise(Thm_2_5_bis, (c,a,c1,a1)))
     assert D4 == Congruent(a,c,a1,c1)
     B8 = p.directproof(D4)
-    p.tertium_non_datur(Equal(a,b))
-    B9 = p.disjunction_elimination(Equal(a,b), -Equal(a,b), Congruent(a,c,a1,c1))
+    B9 = p.tautology(Congruent(a,c,a1,c1), [B7, B8])
     return p.directproof(B9)
 
 @theorem(ForAll((1,2,3,4,5,6),
@@ -203,7 +196,6 @@ def Thm_2_12():
     p.modus_ponens(p.specialise(Thm_2_3, (a,x,b,c,a,y)))
     p.conjunction(p.conjunction(p.conjunction(A1x, A1y), Cqaqa), Congruent(a,x,a,y))
     p.modus_ponens(p.specialise(Thm_2_11, (q,a,x,q,a,y)))
-    print(axioms[4])
     p.conjunction(
         A0,
         p.conjunction(
@@ -341,7 +333,7 @@ def Thm_3_5_2():
     p.assume(Between(b,c,d))
     p.start_context(0)
     p.substitute_equal(A1, Between(a,c,d), p.assume(Equal(b,c)))
-    p.directproof(Between(a,c,d))
+    E = p.directproof(Between(a,c,d))
     p.start_context(0)
     p.assume(-Equal(b,c))
     th = p.specialise(Thm_3_5_1, (a,b,c,d))
@@ -350,10 +342,8 @@ def Thm_3_5_2():
     th = p.specialise(Thm_3_7_1, (a,b,c,d))
     p.auto_conjunction(th.left)
     p.modus_ponens(th)
-    p.directproof(Between(a,c,d))
-    p.tertium_non_datur(Equal(b,c))
-    p.disjunction_elimination(Equal(b,c), -Equal(b,c), Between(a,c,d))
-    return p.directproof(Between(a,c,d))
+    N = p.directproof(Between(a,c,d))
+    return p.directproof(p.tautology(Between(a,c,d), [E, N]))
 
 @theorem(ForAll((1,2,3,4), Between(1,2,3) & Between(1,3,4) >
                            Between(1,2,4)))
@@ -436,10 +426,9 @@ def Thm_3_17():
     p.deduce_right(C)
     p.conjunction(Between(b1,x,a), Between(c,b,a))
     (q,), D = p.instantiate(p.modus_ponens(p.specialise(axioms[6], (b1,c,x,b,a))), 'q')
-    p.conjunction(p.deduce_left(C), p.deduce_left(D))
-    q_prop = p.conjunction(
-        p.modus_ponens(p.specialise(Thm_3_5_2, (p_,x,q,c))),
-        p.deduce_right(D))
+    p.tautology(C.left & D.left, [C, D])
+    Bpqc = p.modus_ponens(p.specialise(Thm_3_5_2, (p_,x,q,c)))
+    q_prop = p.tautology(Bpqc & D.right, [Bpqc, D])
     return p.directproof(p.generalize((q,), q_prop))
 
 def IFS(a,b,c,d,a1,b1,c1,d1):
@@ -467,32 +456,27 @@ def Thm_4_2():
     p.modus_ponens(p.specialise(axioms[5], (c1,b1)))
     p.substitute_equal(Congruent(c,d,c1,d1),Congruent(b,d,c1,d1),Equal(c,b))
     p.substitute_equal(Congruent(b,d,c1,d1),Congruent(b,d,b1,d1),Equal(c1,b1))
-    p.directproof(Congruent(b,d,b1,d1))
+    E = p.directproof(Congruent(b,d,b1,d1))
     p.start_context(0)
     p.assume(-Equal(a,c))
     (e,), con = p.instantiate(p.specialise(Thm_3_14, (a,c)), 'e')
     p.deduce_all(con)
     (e1,), con = p.instantiate(p.specialise(axioms[3], (a1,c1,c,e)), ["e'"])
     p.deduce_all(con)
-    show_congruent(p, c,e,c1,e1)
-    show_congruent(p, e,c,e1,c1)
-    show_congruent(p, c,b,c1,b1)
+    show_congruent(Congruent(c,e,c1,e1))
+    show_congruent(Congruent(e,c,e1,c1))
+    show_congruent(Congruent(c,b,c1,b1))
     p.auto_conjunction(AFS(a,c,e,d,a1,c1,e1,d1))
-    impl = p.specialise(axioms[4], (a,c,e,d,a1,c1,e1,d1))
-    p.auto_conjunction(impl.left)
-    p.modus_ponens(impl)
-    impl = p.specialise(Thm_3_6_1, (a,b,c,e))
-    p.auto_conjunction(impl.left)
-    p.modus_ponens(impl)
-    p.modus_ponens(p.specialise(Thm_3_2, (b,c,e)))
-    impl = p.specialise(Thm_3_6_1, (a1,b1,c1,e1))
-    p.auto_conjunction(impl.left)
-    p.modus_ponens(impl)
-    p.modus_ponens(p.specialise(Thm_3_2, (b1,c1,e1)))
-    p.modus_ponens(p.specialise(symmetry_inequal, (c,e)))
-    impl = p.specialise(axioms[4], (e,c,b,d,e1,c1,b1,d1))
-    p.auto_conjunction(impl.left)
-    p.modus_ponens(impl)
-    p.directproof(Congruent(b,d,b1,d1))
-    p.tertium_non_datur(Equal(a,c))
-    return p.directproof(p.disjunction_elimination(Equal(a,c), -Equal(a,c), Congruent(b,d,b1,d1)))
+    p.apply(axioms[4], Congruent(e,d,e1,d1))
+    p.apply(Thm_3_6_1, Between(b,c,e))
+    p.apply(Thm_3_2, Between(e,c,b))
+    p.apply(Thm_3_6_1, Between(b1,c1,e1))
+    p.apply(Thm_3_2, Between(e1,c1,b1))
+    p.apply(symmetry_inequal, -Equal(e,c))
+    p.apply(axioms[4], Congruent(b,d,b1,d1))
+    N = p.directproof(Congruent(b,d,b1,d1))
+    return p.directproof(p.tautology(Congruent(b,d,b1,d1), [E, N]))
+
+if __name__ == '__main__':
+    library.verify_all()
+    p.log.close()
@@ -0,0 +1,119 @@
+'''one-way matching of formulas against the bodies of universal facts
+
+The body of a universally quantified fact is compiled into a program of
+nested closures, one per node, that tests a formula against the body and
+binds the quantified variables of the fact to its terms. A Matcher holds
+the programs for the body, for its consequent if the body is an
+implication, and for the atoms of its antecedent, which bind the variables
+the consequent leaves open by joining with the atomic facts of a context.
+Matchers are cached per fact, so a library theorem is compiled once
+however often it is applied.
+'''
+from weakref import WeakKeyDictionary
+from formula import Term, PredicateFormula, Negation, BinaryConnective
+
+_matchers = WeakKeyDictionary()
+
+
+def matcher(fact):
+    '''the Matcher of a universally quantified fact'''
+    m = _matchers.get(fact)
+    if m is None:
+        m = _matchers[fact] = Matcher(fact)
+    return m
+
+
+def atoms(formula):
+    '''the atoms among the conjuncts of a conjunction'''
+    if isinstance(formula, BinaryConnective) and formula.connective == '&':
+        return atoms(formula.left) + atoms(formula.right)
+    return [formula] if isinstance(formula, PredicateFormula) else []
+
+
+def _compile(pattern, slots):
+    '''a test(formula, values) of formula against pattern, binding values[slots[v]]
+    for the variables v of pattern'''
+    if isinstance(pattern, PredicateFormula):
+        predicate = pattern.predicate
+        shape = tuple(slots.get(t, t) for t in pattern.terms)
+
+        def test(node, values):
+            if not isinstance(node, PredicateFormula) or node.predicate is not predicate:
+                return False
+            for s, term in zip(shape, node.terms):
+                if not isinstance(s, int):
+                    if s is not term:
+                        return False
+                elif values[s] is None:
+                    values[s] = term
+                elif values[s] is not term:
+                    return False
+            return True
+        return test
+    if isinstance(pattern, Negation):
+        inner = _compile(pattern.formula, slots)
+
+        def test(node, values):
+            return isinstance(node, Negation) and inner(node.formula, values)
+        return test
+    if isinstance(pattern, BinaryConnective):
+        connective = pattern.connective
+        left = _compile(pattern.left, slots)
+        right = _compile(pattern.right, slots)
+
+        def test(node, values):
+            return (isinstance(node, BinaryConnective) and node.connective == connective and
+                    left(node.left, values) and right(node.right, values))
+        return test
+    # a quantifier: both sides are opened with the same fresh terms, which
+    # must not end up bound to a variable
+    cls = type(pattern)
+    fresh = [Term() for _ in pattern.terms]
+    inner = _compile(pattern.open(fresh), slots)
+
+    def test(node, values):
+        return (type(node) is cls and len(node.terms) == len(fresh) and
+                inner(node.open(fresh), values) and not any(v in fresh for v in values))
+    return test
+
+
+class Matcher(object):
+    def __init__(self, fact):
+        variables = [Term() for _ in fact.terms]
+        slots = {v: i for i, v in enumerate(variables)}
+        body = fact.open(variables)
+        self.size = len(variables)
+        self.body = _compile(body, slots)
+        if isinstance(body, BinaryConnective) and body.connective == '->':
+            self.consequent = _compile(body.right, slots)
+            self.atoms = [(atom.predicate, tuple(slots.get(t, t) for t in atom.terms),
+                           _compile(atom, slots)) for atom in atoms(body.left)]
+        else:
+            self.consequent = None
+            self.atoms = []
+
+    def match(self, target, consequent=False):
+        '''the terms of the variables making the body, or with consequent
+        set its consequent, the target, with None for the variables not in it;
+        None if there are none'''
+        program = self.consequent if consequent else self.body
+        values = [None] * self.size
+        if program is not None and program(target, values):
+            return values
+        return None
+
+    def joins(self, values, facts, position=0):
+        '''the extensions of values matching the atoms of the antecedent with
+        the atomic facts of a FactStore'''
+        if position == len(self.atoms):
+            yield values
+            return
+        predicate, shape, program = self.atoms[position]
+        pattern = [values[s] if isinstance(s, int) else s for s in shape]
+        if None not in pattern:
+            yield from self.joins(values, facts, position + 1)
+            return
+        for fact in facts.find(predicate, *pattern):
+            extended = list(values)
+            if program(fact, extended):
+                yield from self.joins(extended, facts, position + 1)
@@ -0,0 +1,211 @@
+'''refutation of formulas in the Euclidean plane, evaluated with numpy
+
+Between, Congruent and Equal are interpreted over points with integer
+coordinates, so that the tests are exact, and a formula is evaluated for a
+batch of random assignments of its free and outer universally quantified
+variables at once. The variables of nested quantifiers range over the
+points of the grid size x size, each along an axis of its own; as the
+arrays grow by a factor size**2 per axis, quantifiers nested more than
+depth variables deep are not evaluated.
+
+The evaluation is three-valued: an atom is true or false, but a nested
+quantifier is only known to be false (universal) or true (existential)
+when the grid holds a witness, and beyond depth it is unknown. An
+assignment under which the formula is known to be false is therefore a
+counterexample in the plane, which is confirmed by evaluating it again
+with exact rational arithmetic without numpy.
+
+A Model needs numpy, which the verifier does not.
+
+usage: python model.py    # look for counterexamples to the theorems of main.py
+'''
+import sys
+import time
+from fractions import Fraction
+from itertools import product
+import numpy as np
+from formula import (Term, PredicateFormula, Negation, BinaryConnective,
+                     UniversalQuantifier)
+from tarski import Between, Congruent, Equal
+
+
+def between(a, b, c):
+    ab = b - a
+    ac = c - a
+    cross = ab[..., 0] * ac[..., 1] - ab[..., 1] * ac[..., 0]
+    return (cross == 0) & (((b - a) * (c - b)).sum(-1) >= 0)
+
+
+def congruent(a, b, c, d):
+    return ((a - b) ** 2).sum(-1) == ((c - d) ** 2).sum(-1)
+
+
+def equal(a, b):
+    return (a == b).all(-1)
+
+
+INTERPRETATION = {Between: between, Congruent: congruent, Equal: equal}
+
+
+def exact_between(a, b, c):
+    cross = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    return cross == 0 and (b[0] - a[0]) * (c[0] - b[0]) + (b[1] - a[1]) * (c[1] - b[1]) >= 0
+
+
+def exact_congruent(a, b, c, d):
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 == (c[0] - d[0]) ** 2 + (c[1] - d[1]) ** 2
+
+
+def exact_equal(a, b):
+    return a == b
+
+
+EXACT = {Between: exact_between, Congruent: exact_congruent, Equal: exact_equal}
+
+
+def nesting(formula):
+    '''the largest number of variables of nested quantifiers'''
+    if isinstance(formula, PredicateFormula):
+        return 0
+    if isinstance(formula, Negation):
+        return nesting(formula.formula)
+    if isinstance(formula, BinaryConnective):
+        return max(nesting(formula.left), nesting(formula.right))
+    return len(formula.terms) + nesting(formula.formula)
+
+
+def connect(connective, left, right):
+    '''(known true, known false) of a connective of two such pairs'''
+    (lt, lf), (rt, rf) = left, right
+    if connective == '&':
+        return lt & rt, lf | rf
+    if connective == '|':
+        return lt | rt, lf & rf
+    return lf | rt, lt & rf
+
+
+class Model(object):
+    '''random assignments of points of the grid size x size, samples at a
+    time, with at most depth nested quantified variables'''
+    def __init__(self, size=5, samples=4096, depth=2, seed=0):
+        self.size = size
+        self.samples = samples
+        self.depth = depth
+        self.random = np.random.default_rng(seed)
+        grid = np.arange(size)
+        self.domain = np.stack(np.meshgrid(grid, grid), -1).reshape(-1, 2)
+
+    def evaluate(self, formula, env, axes, axis=1):
+        '''(known true, known false) of formula for the points of env, arrays
+        with a batch axis, one axis per nested variable and the coordinates'''
+        if isinstance(formula, PredicateFormula):
+            value = INTERPRETATION[formula.predicate](*(env[t] for t in formula.terms))
+            return value, ~value
+        if isinstance(formula, Negation):
+            true, false = self.evaluate(formula.formula, env, axes, axis)
+            return false, true
+        if isinstance(formula, BinaryConnective):
+            return connect(formula.connective, self.evaluate(formula.left, env, axes, axis),
+                           self.evaluate(formula.right, env, axes, axis))
+        if axis + len(formula.terms) > axes + 1:
+            return np.False_, np.False_
+        terms = [Term() for _ in formula.terms]
+        env = dict(env)
+        for i, t in enumerate(terms):
+            shape = [1] * (axes + 1) + [2]
+            shape[axis + i] = len(self.domain)
+            env[t] = self.domain.reshape(shape)
+        true, false = self.evaluate(formula.open(terms), env, axes, axis + len(terms))
+        # a nested quantifier may leave one of the values a scalar
+        shape = np.broadcast_shapes(np.shape(true), np.shape(false), (1,) * (axes + 1))
+        true, false = np.broadcast_to(true, shape), np.broadcast_to(false, shape)
+        inner = tuple(range(axis, axis + len(terms)))
+        if isinstance(formula, UniversalQuantifier):
+            return np.False_, np.any(false, axis=inner, keepdims=True)
+        return np.any(true, axis=inner, keepdims=True), np.False_
+
+    def counterexample(self, formula):
+        '''points for the outer universal and the free variables of formula under
+        which it is false, as a list of (term, point) pairs, or None'''
+        variables = list(formula.free())
+        while isinstance(formula, UniversalQuantifier):
+            terms = [Term() for _ in formula.terms]
+            formula = formula.open(terms)
+            variables += terms
+        axes = min(nesting(formula), self.depth)
+        batch = max(1, self.samples // len(self.domain) ** axes)
+        env = {}
+        for t in variables:
+            points = self.random.integers(0, self.size, (batch, 2))
+            env[t] = points.reshape([batch] + [1] * axes + [2])
+        _true, false = self.evaluate(formula, env, axes)
+        false = np.broadcast_to(false, (batch,) + (1,) * axes).reshape(batch)
+        for i in np.flatnonzero(false):
+            assignment = [(t, tuple(Fraction(int(x)) for x in env[t].reshape(batch, 2)[i]))
+                          for t in variables]
+            if self.confirm(formula, dict(assignment), axes):
+                return assignment
+        return None
+
+    def confirm(self, formula, assignment, depth=None):
+        '''whether formula is known to be false for the rational points of
+        assignment, evaluating quantifiers nested at most depth variables deep'''
+        domain = [tuple(Fraction(int(x)) for x in point) for point in self.domain]
+        return self._exact(formula, assignment, domain, self.depth if depth is None else depth)[1]
+
+    def _exact(self, formula, assignment, domain, depth):
+        if isinstance(formula, PredicateFormula):
+            value = EXACT[formula.predicate](*(assignment[t] for t in formula.terms))
+            return value, not value
+        if isinstance(formula, Negation):
+            true, false = self._exact(formula.formula, assignment, domain, depth)
+            return false, true
+        if isinstance(formula, BinaryConnective):
+            return connect(formula.connective, self._exact(formula.left, assignment, domain, depth),
+                           self._exact(formula.right, assignment, domain, depth))
+        if len(formula.terms) > depth:
+            return False, False
+        terms = [Term() for _ in formula.terms]
+        body = formula.open(terms)
+        witness = False
+        for points in product(domain, repeat=len(terms)):
+            true, false = self._exact(body, {**assignment, **dict(zip(terms, points))}, domain,
+                                      depth - len(terms))
+            if false if isinstance(formula, UniversalQuantifier) else true:
+                witness = True
+                break
+        if isinstance(formula, UniversalQuantifier):
+            return False, witness
+        return witness, False
+
+    def oracle(self, context):
+        '''a test of the goals of a search in context: False if the goal is
+        refuted by points satisfying the assumptions and the existential
+        instantiations of the open scopes'''
+        def may_hold(goal):
+            hypotheses = [fact for fact, _number, justification, _references, _evidence
+                          in context.facts.values()
+                          if justification in ('assumption', 'existential instantiation')]
+            formula = goal
+            if hypotheses:
+                conditions = hypotheses[0]
+                for h in hypotheses[1:]:
+                    conditions = conditions & h
+                formula = conditions > goal
+            return self.counterexample(formula) is None
+        return may_hold
+
+
+if __name__ == '__main__':
+    import main
+    model = Model()
+    refuted = 0
+    for name, theorem in main.library.theorems.items():
+        start = time.perf_counter()
+        found = model.counterexample(theorem.statement)
+        elapsed = time.perf_counter() - start
+        print('%-16s %s %8.3f ms' % (name, 'REFUTED' if found is not None else 'no counterexample', elapsed * 1000))
+        if found is not None:
+            print('    at ' + ' '.join('(%s, %s)' % point for _term, point in found))
+        refuted += found is not None
+    sys.exit(1 if refuted else 0)
@@ -0,0 +1,63 @@
+'''verification of the theorems of main.py in a pool of processes
+
+Every theorem is verified in a separate ProofContext, seeded with the axioms
+and the statements of the theorems its proof refers to. The theorems are
+therefore independent of each other and are all verified concurrently; the
+dependency graph decides which statements seed each context and which
+theorems are not established because a prerequisite failed.
+
+usage: python parallel.py [processes]
+'''
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from log import SilentLog
+from proof import ProofContext
+from tarski import axioms, equality_axioms
+
+
+def load():
+    '''the library of main.py, declared without verifying it'''
+    import main
+    return main.library
+
+
+def verify(name, dependencies):
+    '''verify one theorem in a new context, returning the time taken'''
+    start = time.perf_counter()
+    lib = load()
+    p = lib.namespace['p'] = ProofContext(axioms+equality_axioms, log=SilentLog(), evidence=False)
+    for dependency in dependencies:
+        p.recall(lib.theorems[dependency].statement)
+    lib.check(lib.theorems[name])
+    return time.perf_counter() - start
+
+
+def verify_parallel(processes=None):
+    '''verify the library, returning the names of the theorems not established'''
+    lib = load()
+    dependencies = {name: lib.dependencies(name) for name in lib.theorems}
+    failed = set()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(processes, initializer=load) as pool:
+        futures = {pool.submit(verify, name, sorted(dependencies[name])): name
+                   for name in lib.theorems}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                print('%-16s verified in %.3f s' % (name, future.result()))
+            except Exception as e:
+                print('%-16s FAILED %r' % (name, e))
+                failed.add(name)
+    for name in lib.theorems:
+        if dependencies[name] & failed and name not in failed:
+            print('%-16s not established, depends on %s' % (
+                name, ', '.join(sorted(dependencies[name] & failed))))
+            failed.add(name)
+    print('%d theorems in %.3f s' % (len(lib.theorems), time.perf_counter() - start))
+    return failed
+
+
+if __name__ == '__main__':
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    sys.exit(1 if verify_parallel(processes) else 0)
@@ -1,70 +1,197 @@
-from formula import Term, ExistentialQuantifier, TermContext, FreeTerm, BinaryConnective
+from formula import Term, ExistentialQuantifier, TermContext, FreeTerm, BinaryConnective, PredicateFormula, OrderedFrozenSet, OVERFLOW, term_bit
 from itertools import count
 from tarski import Equal
+from log import TextLog
+from search import Search
+from match import matcher
+from index import TheoremIndex
+from sat import consequence
+
+class FactStore(object):
+    '''facts of all open scopes in a single dictionary.
+
+    Every scope keeps an undo log of the facts added to it, so lookup does not
+    depend on the nesting depth and closing a scope only touches its own facts.
+    Atomic facts are additionally indexed by predicate and argument terms.
+    '''
+    def __init__(self):
+        self._facts = {}
+        self._levels = {}
+        self._scopes = [[]]
+        self._atoms = {}
+        self._arguments = {}
+
+    def __getitem__(self, key):
+        return self._facts[key]
 
-class DictStack(dict):
-    def __init__(self, parent=None):
-        dict.__init__(self)
-        self._parent = parent
+    def __contains__(self, key):
+        return key in self._facts
 
-    def __missing__(self, key):
-        if self._parent is None:
-            raise KeyError(key)
-        return self._parent[key]
+    def __setitem__(self, key, value):
+        assert key not in self._facts
+        self._facts[key] = value
+        self._levels[key] = len(self._scopes) - 1
+        self._scopes[-1].append(key)
+        if isinstance(key, PredicateFormula):
+            self._index(key)
 
-    def push(self):
-        return DictStack(self)
+    def __len__(self):
+        return len(self._facts)
 
-    def pop(self):
-        assert self._parent is not None
-        return self._parent
+    def __iter__(self):
+        return iter(self._facts)
 
-    def __contains__(self, key):
-        try:
-            self[key]
-            return True
-        except KeyError:
-            return False
+    def values(self):
+        return self._facts.values()
+
+    @property
+    def depth(self):
+        return len(self._scopes) - 1
+
+    def level(self, key):
+        '''the depth of the scope the fact was added in'''
+        return self._levels[key]
+
+    def push(self):
+        self._scopes.append([])
+
+    def pop(self, entries=False):
+        '''close the innermost scope; with entries set, return the entries of
+        its facts in the order they were added'''
+        assert len(self._scopes) > 1
+        facts = self._facts
+        keys = self._scopes.pop()
+        popped = tuple(facts[key] for key in keys) if entries else None
+        for key in keys:
+            del facts[key]
+            del self._levels[key]
+            if isinstance(key, PredicateFormula):
+                self._unindex(key)
+        return popped
+
+    def scope(self):
+        '''the facts added in the innermost scope'''
+        facts = self._facts
+        return {key: facts[key] for key in self._scopes[-1]}
+
+    def _index_keys(self, atom):
+        yield atom.predicate
+        for position, term in enumerate(atom.terms):
+            yield (atom.predicate, position, term)
+
+    def _index(self, atom):
+        self._atoms[atom.predicate, atom.terms] = atom
+        for key in self._index_keys(atom):
+            self._arguments.setdefault(key, {})[atom] = None
+
+    def _unindex(self, atom):
+        del self._atoms[atom.predicate, atom.terms]
+        for key in self._index_keys(atom):
+            atoms = self._arguments[key]
+            del atoms[atom]
+            if not atoms:
+                del self._arguments[key]
+
+    def find(self, predicate, *terms):
+        '''atomic facts predicate(*terms) in scope, where None matches any term'''
+        assert len(terms) == predicate.arity
+        if None not in terms:
+            atom = self._atoms.get((predicate, terms))
+            return [] if atom is None else [atom]
+        keys = [(predicate, i, t) for i, t in enumerate(terms) if t is not None] or [predicate]
+        candidates = min((self._arguments.get(key, {}) for key in keys), key=len)
+        return [atom for atom in candidates
+                if all(t is None or t is x for t, x in zip(terms, atom.terms))]
 
 
 class ProofContext():
-    def __init__(self, axioms):
+    '''facts derived from axioms by the rules of natural deduction.
+
+    A direct proof keeps the entries of the facts of its scope as the
+    evidence of its conclusion. With evidence off they are dropped once the
+    conclusion is added, so that only the facts of the open scopes stay in
+    memory.
+    '''
+    def __init__(self, axioms, log=None, evidence=True):
+        self.log = TextLog() if log is None else log
+        self.evidence = evidence
         self.fact_number = count(1)
-        self.facts = DictStack()
+        self.facts = FactStore()
         self.freevars = []
+        # the bits of the free variables of all open scopes, per scope
+        self._freebits = [0]
+        # the free variables sharing the OVERFLOW bit, per scope
+        self._overflow = [set()]
         self.assumptions = []
+        # the facts of outer scopes referenced in each open scope
+        self._outer = []
         self.term_ctx = TermContext()
+        # notified through fact_added(fact) and context_closed(depth)
+        self.listeners = []
+        # the universal facts in scope, by their heads and antecedent atoms
+        self.index = TheoremIndex(self)
 
         for axiom in axioms:
             self._add(axiom, 'Axiom')
 
     def _add(self, fact, justification, references=(), evidence=None):
         assert fact not in self.facts
-        assert all(any(x in y for y in self.freevars) for x in fact.free())
+        assert self._in_scope(fact.free())
         try:
-            [self.facts[r] for r in references]
+            numbers = [self.facts[r][1] for r in references]
         except KeyError as e:
             assert False, 'Missing Fact %s' % (e.args)
         number = next(self.fact_number)
+        depth = self.facts.depth
+        if depth:
+            outer = self._outer[-1]
+            for r in references:
+                if self.facts.level(r) < depth:
+                    outer[r] = None
         self.facts[fact] = (fact, number, justification, references, evidence)
-        if not references:
-            ref = ''
-        else:
-            ref = '(%s)' % ', '.join(str(self.facts[r][1]) for r in references)
-        print(number, '  '*len(self.assumptions), fact, justification, ref)
+        self.log.fact(number, fact, justification, numbers, len(self.assumptions))
+        for listener in self.listeners:
+            listener.fact_added(fact)
+
+    def find(self, predicate, *terms):
+        return self.facts.find(predicate, *terms)
+
+    def _in_scope(self, terms):
+        '''whether the set terms holds only free variables of the open scopes'''
+        if terms.mask & ~self._freebits[-1]:
+            return False
+        if terms.mask & OVERFLOW:
+            return all(term_bit(x) != OVERFLOW or any(x in overflow for overflow in self._overflow)
+                       for x in terms)
+        return True
 
     def _start_context(self, variables):
-        self.facts = self.facts.push()
+        self.facts.push()
         self.freevars.append(variables)
+        self._freebits.append(self._freebits[-1] | OrderedFrozenSet(variables).mask)
+        self._overflow.append({x for x in variables if term_bit(x) == OVERFLOW})
         self.assumptions.append([])
+        self._outer.append({})
         return variables
 
+    def _pop(self, entries=False):
+        entries = self.facts.pop(entries)
+        for listener in self.listeners:
+            listener.context_closed(self.facts.depth)
+        return entries
+
     def start_context(self, number_of_variables):
         return self._start_context([FreeTerm(self.term_ctx) for _ in range(number_of_variables)])
 
     def start_context_names(self, names):
         return self._start_context([FreeTerm(self.term_ctx, n) for n in names])
 
+    def recall(self, fact):
+        '''add a theorem verified in another context'''
+        assert not self.assumptions
+        self._add(fact, 'Theorem')
+        return fact
+
     def assume(self, fact):
         self.assumptions[-1].append(fact)
         self._add(fact, 'assumption', [])
@@ -73,6 +200,8 @@ class ProofContext():
     def directproof(self, fact):
         assump = self.assumptions.pop()
         freevars = self.freevars.pop()
+        self._freebits.pop()
+        self._overflow.pop()
         assert fact in self.facts
 
         if not assump:
@@ -83,18 +212,24 @@ class ProofContext():
                 conditions = conditions & x
             new_fact = conditions > fact
         new_fact = new_fact.generalize([v for v in freevars if v in new_fact.free()])
-        evidence = dict(self.facts)
-        self.facts = self.facts.pop()
-        outer_references = set()
-        for (_fact, _number, _justification, references, _evidence) in evidence.values():
-            for ref in references:
-                if ref not in evidence:
-                     outer_references.add(ref)
-        self._add(new_fact, 'direct proof', list(outer_references), evidence)
+        outer_references = list(self._outer.pop())
+        evidence = self._pop(self.evidence)
+        self._add(new_fact, 'direct proof', outer_references, evidence)
         for var in freevars:
             self.term_ctx.discard(var)
         return new_fact
 
+    def abandon(self):
+        '''close the innermost context without concluding anything from it'''
+        self.assumptions.pop()
+        freevars = self.freevars.pop()
+        self._freebits.pop()
+        self._overflow.pop()
+        self._outer.pop()
+        self._pop()
+        for var in freevars:
+            self.term_ctx.discard(var)
+
     def disjunction_elimination(self, P, Q, R):
         self._add(R, 'disjunction elimination', [P>R, Q>R, P|Q])
         return R
@@ -108,26 +243,59 @@ class ProofContext():
         self._add(-(P & -P), 'non contradiction', [])
 
 
+    def tautology(self, goal, premises=()):
+        '''goal as a propositional consequence of the premises, facts in scope'''
+        assert consequence(goal, premises), 'not a propositional consequence: %s' % goal
+        self._add(goal, 'tautology', list(premises))
+        return goal
+
     def specialise(self, fact, subs):
-        if len(subs) > len(fact.terms):
-            assert f'too many substitutions in {fact} \\ {subs}'
-        new_fact = fact
-        for i,s in reversed(list(enumerate(subs))):
-            new_fact = new_fact.specialise(i, s)
+        assert len(subs) <= len(fact.terms), f'too many substitutions in {fact} \\ {subs}'
+        new_fact = fact.specialise_terms(subs)
         self._add(new_fact, 'universal specialisation', [fact])
         return new_fact
 
+    def specialise_to(self, fact, target):
+        '''specialise fact to target, with the terms found by matching them'''
+        values = matcher(fact).match(target)
+        assert values is not None and None not in values, 'cannot match %s with %s' % (fact, target)
+        new_fact = self.specialise(fact, values)
+        assert new_fact == target
+        return new_fact
+
+    def apply(self, fact, target):
+        '''derive target from a fact A(x..): P(x..) -> Q(x..) whose consequent
+        matches it, binding the variables not in Q by matching the atoms of P
+        with the atomic facts, deriving P by conjunction and concluding by
+        modus ponens'''
+        m = matcher(fact)
+        values = m.match(target, True)
+        assert values is not None, 'cannot match %s with %s' % (fact, target)
+        values = next((v for v in m.joins(values, self.facts) if None not in v and
+                       self._conjoinable(fact.specialise_terms(v).left)), None)
+        assert values is not None, 'cannot bind the variables of %s' % (fact,)
+        implication = self.specialise(fact, values)
+        self.auto_conjunction(implication.left)
+        return self.modus_ponens(implication)
+
+    def _conjoinable(self, conjunction):
+        '''whether conjunction is a fact or a conjunction of such'''
+        if conjunction in self.facts:
+            return True
+        return (isinstance(conjunction, BinaryConnective) and conjunction.connective == '&' and
+                self._conjoinable(conjunction.left) and self._conjoinable(conjunction.right))
+
     def instantiate(self, fact, hint=None):
         assert isinstance(fact, ExistentialQuantifier)
         if hint is None:
-            subs = [(var, FreeTerm(self.term_ctx)) for var in fact.bound()]
+            new_vars = [FreeTerm(self.term_ctx) for _ in fact.terms]
         else:
-            assert len(hint) == len(fact.bound())
-            subs = [(var, FreeTerm(self.term_ctx, hint)) for var,hint in zip(fact.bound(), hint)]
-        new_vars = [t for _,t in subs]
+            assert len(hint) == len(fact.terms)
+            new_vars = [FreeTerm(self.term_ctx, hint) for hint in hint]
         self.freevars[-1].extend(new_vars)
-        subs = dict(subs)
-        new_fact = fact.formula.substitute(subs)
+        self._freebits[-1] |= OrderedFrozenSet(new_vars).mask
+        self._overflow[-1].update(x for x in new_vars if term_bit(x) == OVERFLOW)
+        new_fact = fact.open(new_vars)
         self._add(new_fact, 'existential instantiation', [fact])
         return new_vars, new_fact
 
@@ -181,6 +349,16 @@ class ProofContext():
         self._add(-P, 'modus tollens', [P>Q, -Q])
         return -P
 
+    def prove(self, goal, using=None, max_depth=3):
+        '''derive goal by backward chaining from the facts in scope through
+        the implications and theorems whose consequent matches it, returning
+        it, or None if no derivation with at most max_depth nested modus
+        ponens was found. With using set, only the theorems in using are
+        applied; a proof should name the theorems it relies on that way.'''
+        for theorem in using or ():
+            assert theorem in self.facts, 'Missing Fact %s' % theorem
+        return Search(self, max_depth=max_depth, goal_directed=True, using=using).prove(goal)
+
     def auto_conjunction(self, conjunction):
         if conjunction in self.facts:
             return
@@ -0,0 +1,242 @@
+'''incremental forward chaining with a Rete network
+
+Universally quantified facts of the form A(x..): L1 & ... & Ln -> C, where
+the Li are atoms or negated atoms mentioning all the variables, are compiled
+into a network. Alpha nodes test a single fact against one literal pattern
+and are shared between rules; a chain of join nodes per rule keeps the
+partial matches of its first k literals. A new fact is only joined with the
+partial matches it extends, so rules fire exactly when their antecedent
+becomes satisfied, and firing goes through the ordinary ProofContext rules.
+'''
+from collections import deque
+from formula import PredicateFormula, Negation, BinaryConnective, UniversalQuantifier
+from search import Rule
+
+
+def literals(formula):
+    '''the conjuncts of a conjunction'''
+    if isinstance(formula, BinaryConnective) and formula.connective == '&':
+        return literals(formula.left) + literals(formula.right)
+    return [formula]
+
+
+def atom_of(literal):
+    '''(negated, atom) of a literal, or None if it is not a literal'''
+    negated = isinstance(literal, Negation)
+    atom = literal.formula if negated else literal
+    if isinstance(atom, PredicateFormula):
+        return negated, atom
+    return None
+
+
+class AlphaNode(object):
+    '''facts matching one literal pattern; shape holds for each argument
+    the number of a pattern variable or a constant term'''
+    def __init__(self, negated, predicate, shape):
+        self.negated = negated
+        self.predicate = predicate
+        self.shape = shape
+        self.size = sum(1 for s in shape if isinstance(s, int))
+        self.memory = []
+        self.successors = []
+
+    def test(self, atom):
+        values = [None] * self.size
+        for s, term in zip(self.shape, atom.terms):
+            if not isinstance(s, int):
+                if s is not term:
+                    return None
+            elif values[s] is None:
+                values[s] = term
+            elif values[s] is not term:
+                return None
+        return values
+
+
+class JoinNode(object):
+    '''partial matches of the first position+1 literals of a rule'''
+    def __init__(self, rule, position, alpha, indexes):
+        self.rule = rule
+        self.position = position
+        self.alpha = alpha
+        self.indexes = indexes
+        self.memory = []
+        self.next = None
+
+
+class ReteRule(Rule):
+    def __init__(self, fact, level):
+        Rule.__init__(self, fact)
+        self.level = level
+        self.joins = []
+
+
+class Saturation(object):
+    '''forward chaining of the Horn-like facts of a ProofContext
+
+    If rules is given only these facts are used as rules, otherwise every
+    suitable universally quantified fact in scope, including those proved
+    later. A derived fact has depth one more than the deepest fact it was
+    derived from, other facts depth 0; nothing deeper than max_depth is
+    derived and at most max_fired rule applications are made.
+    '''
+    def __init__(self, context, rules=None, max_depth=2, max_fired=1000):
+        self.context = context
+        self.max_depth = max_depth
+        self.max_fired = max_fired
+        self.fired = 0
+        self.derived = {}
+        self.agenda = deque()
+        self._alphas = {}
+        self._rules = []
+        self._accepted = None if rules is None else set(rules)
+        self._running = False
+        for fact in list(context.facts):
+            self._compile(fact)
+        context.listeners.append(self)
+        self._run()
+
+    def close(self):
+        self.context.listeners.remove(self)
+
+    def _compile(self, fact):
+        if not isinstance(fact, UniversalQuantifier):
+            return
+        if self._accepted is not None and fact not in self._accepted:
+            return
+        rule = ReteRule(fact, self.context.facts.level(fact))
+        if rule.antecedent is None:
+            return
+        patterns = [atom_of(literal) for literal in literals(rule.antecedent)]
+        if None in patterns:
+            return
+        if any(all(v not in atom.free() for _, atom in patterns) for v in rule.variables):
+            return
+        variables = {v: i for i, v in enumerate(rule.variables)}
+        new_alphas = []
+        for position, (negated, atom) in enumerate(patterns):
+            slots = []
+            shape = []
+            for term in atom.terms:
+                if term in variables:
+                    if term not in slots:
+                        slots.append(term)
+                    shape.append(slots.index(term))
+                else:
+                    shape.append(term)
+            shape = tuple(shape)
+            alpha = self._alpha(negated, atom.predicate, shape, new_alphas)
+            join = JoinNode(rule, position, alpha, [variables[v] for v in slots])
+            if rule.joins:
+                rule.joins[-1].next = join
+            rule.joins.append(join)
+            alpha.successors.append(join)
+        self._rules.append(rule)
+        for alpha in new_alphas:
+            for fact in self.context.facts:
+                self._store(alpha, fact, self.context.facts.level(fact))
+        first = rule.joins[0]
+        for entry in list(first.alpha.memory):
+            self._right_activate(first, entry)
+
+    def _alpha(self, negated, predicate, shape, new_alphas):
+        for alpha in self._alphas.get((negated, predicate), ()):
+            if alpha.shape == shape:
+                return alpha
+        alpha = AlphaNode(negated, predicate, shape)
+        self._alphas.setdefault((negated, predicate), []).append(alpha)
+        new_alphas.append(alpha)
+        return alpha
+
+    def _store(self, alpha, fact, level):
+        literal = atom_of(fact)
+        if literal is None or literal[0] != alpha.negated or literal[1].predicate is not alpha.predicate:
+            return None
+        values = alpha.test(literal[1])
+        if values is None:
+            return None
+        entry = (fact, values, level)
+        alpha.memory.append(entry)
+        return entry
+
+    def fact_added(self, fact):
+        level = self.context.facts.depth
+        self._compile(fact)
+        literal = atom_of(fact)
+        if literal is not None:
+            for alpha in self._alphas.get((literal[0], literal[1].predicate), ()):
+                entry = self._store(alpha, fact, level)
+                if entry is not None:
+                    # later literals first, so that a fact matching several
+                    # literals of a rule is not joined with itself twice
+                    for join in reversed(alpha.successors):
+                        self._right_activate(join, entry)
+        self._run()
+
+    def _right_activate(self, join, entry):
+        if join.position == 0:
+            tokens = [((None,) * len(join.rule.variables), (), 0, 0)]
+        else:
+            tokens = list(join.rule.joins[join.position - 1].memory)
+        for token in tokens:
+            self._join(join, token, entry)
+
+    def _join(self, join, token, entry):
+        values, facts, level, depth = token
+        fact, slot_values, fact_level = entry
+        values = list(values)
+        for i, value in zip(join.indexes, slot_values):
+            if values[i] is None:
+                values[i] = value
+            elif values[i] is not value:
+                return
+        token = (tuple(values), facts + (fact,), max(level, fact_level),
+                 max(depth, self.derived.get(fact, 0)))
+        join.memory.append(token)
+        if join.next is None:
+            if token[3] < self.max_depth:
+                self.agenda.append((join.rule, token))
+        else:
+            for entry in list(join.next.alpha.memory):
+                self._join(join.next, token, entry)
+
+    def _run(self):
+        if self._running:
+            return
+        self._running = True
+        try:
+            while self.agenda and self.fired < self.max_fired:
+                rule, token = self.agenda.popleft()
+                self._fire(rule, token)
+        finally:
+            self._running = False
+
+    def _fire(self, rule, token):
+        p = self.context
+        values, facts, level, depth = token
+        specialised = rule.instance(values)
+        consequent = specialised.right
+        if consequent in p.facts:
+            return
+        if specialised not in p.facts:
+            p.specialise(rule.fact, values)
+        p.auto_conjunction(specialised.left)
+        self.derived[consequent] = depth + 1
+        p.modus_ponens2(specialised.left, consequent)
+        self.fired += 1
+
+    def context_closed(self, depth):
+        for alphas in self._alphas.values():
+            for alpha in alphas:
+                alpha.memory = [e for e in alpha.memory if e[2] <= depth]
+        closed = [rule for rule in self._rules if rule.level > depth]
+        for rule in closed:
+            for join in rule.joins:
+                join.alpha.successors.remove(join)
+        self._rules = [rule for rule in self._rules if rule.level <= depth]
+        for rule in self._rules:
+            for join in rule.joins:
+                join.memory = [t for t in join.memory if t[2] <= depth]
+        self.agenda = deque((rule, token) for rule, token in self.agenda
+                            if rule.level <= depth and token[2] <= depth)
+        self.derived = {fact: d for fact, d in self.derived.items() if fact in self.context.facts}
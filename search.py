@@ -0,0 +1,297 @@
+'''automated proof search on top of the rules of ProofContext
+
+The search works backwards from the goal with iterative deepening. A plan is
+a tree of rule applications (rule, formula, subplans, arguments); once a
+plan is found it is replayed through the ProofContext, so every step of it
+is verified like a handwritten proof.
+
+usage: python search.py    # replays the searches of check_regressions
+'''
+import time
+from itertools import product
+from formula import (Term, BinaryConnective,
+                     UniversalQuantifier, ExistentialQuantifier)
+from tarski import Equal
+from match import matcher
+
+
+class SearchExhausted(Exception):
+    pass
+
+
+class Rule(object):
+    '''a universally quantified fact, opened with placeholder variables'''
+    def __init__(self, fact):
+        self.fact = fact
+        self.variables = [Term() for _ in fact.terms]
+        self.body = fact.open(self.variables)
+        if isinstance(self.body, BinaryConnective) and self.body.connective == '->':
+            self.antecedent = self.body.left
+            self.consequent = self.body.right
+        else:
+            self.antecedent = None
+            self.consequent = self.body
+        self.matcher = matcher(fact)
+
+    def instances(self, goal, terms, facts=None):
+        '''substitutions for the variables making the consequent the goal.
+
+        Variables not bound by the goal range over terms or, if facts is
+        given, are bound by matching the atoms of the antecedent with the
+        atomic facts.
+        '''
+        values = self.matcher.match(goal, self.antecedent is not None)
+        if values is None:
+            return
+        if facts is not None:
+            for joined in self.matcher.joins(values, facts):
+                if None not in joined:
+                    yield tuple(joined)
+            return
+        unbound = [i for i, v in enumerate(values) if v is None]
+        for choice in product(terms, repeat=len(unbound)):
+            for i, t in zip(unbound, choice):
+                values[i] = t
+            yield tuple(values)
+
+    def instance(self, terms, part=None):
+        '''the body, or part of it, specialised to the terms'''
+        return (part or self.body).substitute(dict(zip(self.variables, terms)))
+
+
+class Search(object):
+    '''iterative deepening backward search for a goal in a ProofContext
+
+    max_depth bounds the number of nested specialisations, modus ponens,
+    equality substitutions and generalizations; max_nodes and timeout (in
+    seconds) bound the effort. If instantiate is set, existential facts of
+    the innermost context are instantiated before searching so that their
+    witnesses are available.
+
+    A goal directed search only uses modus ponens with the implications
+    and universal facts whose consequent matches the goal, binding their
+    other variables with the atomic facts in scope instead of trying every
+    term, and no equality substitutions or generalizations.
+
+    With using set, only the universal facts in using are specialised,
+    instead of all those in scope.
+
+    An oracle, a function of a goal such as Model.oracle(context), prunes
+    the goals for which it returns False.
+    '''
+    def __init__(self, context, max_depth=4, max_nodes=100000, timeout=None, instantiate=False,
+                 goal_directed=False, using=None, oracle=None):
+        self.context = context
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.timeout = timeout
+        self.instantiate = instantiate
+        self.goal_directed = goal_directed
+        self.using = None if using is None else set(using)
+        self.oracle = oracle
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.exhausted = False
+
+    def prove(self, goal):
+        '''derive goal in the context, returning it, or None if no proof was found'''
+        start = time.perf_counter()
+        self._deadline = None if self.timeout is None else start + self.timeout
+        try:
+            if self.instantiate:
+                self._instantiate()
+            self._prepare()
+            plan = None
+            try:
+                for depth in range(self.max_depth + 1):
+                    plan = self._prove(goal, depth)
+                    if plan is not None:
+                        break
+            except SearchExhausted:
+                self.exhausted = True
+            if plan is None:
+                return None
+            return self._emit(plan)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+    def _instantiate(self):
+        p = self.context
+        for fact in list(p.facts.scope()):
+            if isinstance(fact, ExistentialQuantifier):
+                p.instantiate(fact)
+
+    def _prepare(self):
+        p = self.context
+        self.terms = [v for variables in p.freevars for v in variables]
+        self._rules = {}
+        self._implications = {}
+        self._parts = {}
+        for fact in p.facts:
+            if isinstance(fact, BinaryConnective):
+                if fact.connective == '->':
+                    self._implications.setdefault(fact.right, []).append(fact)
+                elif fact.connective == '&':
+                    self._add_parts(fact)
+        self._identities = p.find(Equal, None, None)
+        self._proved = {}
+        self._failed = {}
+        self._refuted = {}
+
+    def _add_parts(self, conjunction):
+        for side, part in (('left', conjunction.left), ('right', conjunction.right)):
+            if part not in self._parts:
+                self._parts[part] = (side, conjunction)
+                if isinstance(part, BinaryConnective) and part.connective == '&':
+                    self._add_parts(part)
+
+    def _count(self):
+        self.nodes += 1
+        if self.nodes >= self.max_nodes:
+            raise SearchExhausted()
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise SearchExhausted()
+
+    def _prove(self, goal, depth):
+        self._count()
+        if goal in self.context.facts:
+            return ('fact', goal, (), None)
+        plan = self._proved.get(goal)
+        if plan is not None:
+            return plan
+        if self._failed.get(goal, -1) >= depth:
+            return None
+        if self.oracle is not None:
+            refuted = self._refuted.get(goal)
+            if refuted is None:
+                refuted = self._refuted[goal] = not self.oracle(goal)
+            if refuted:
+                return None
+        for plan in self._plans(goal, depth):
+            if plan is not None:
+                self._proved[goal] = plan
+                return plan
+        self._failed[goal] = depth
+        return None
+
+    def _all(self, goals, depth):
+        plans = []
+        for goal in goals:
+            plan = self._prove(goal, depth)
+            if plan is None:
+                return None
+            plans.append(plan)
+        return tuple(plans)
+
+    def _plans(self, goal, depth):
+        if isinstance(goal, BinaryConnective) and goal.connective == '&':
+            plans = self._all((goal.left, goal.right), depth)
+            yield plans and ('conjunction', goal, plans, None)
+        if goal in self._parts:
+            side, whole = self._parts[goal]
+            plans = self._all((whole,), depth)
+            yield plans and (side, goal, plans, None)
+        if depth == 0:
+            return
+        for implication in self._implications.get(goal, ()):
+            plans = self._all((implication, implication.left), depth - 1)
+            yield plans and ('modus_ponens', goal, plans, None)
+        facts = self.context.facts if self.goal_directed else None
+        for fact in self.context.index.generalisations(goal):
+            if self.using is not None and fact not in self.using:
+                continue
+            rule = self._rules.get(fact)
+            if rule is None:
+                rule = self._rules[fact] = Rule(fact)
+            for terms in rule.instances(goal, self.terms, facts):
+                self._count()
+                if rule.antecedent is None:
+                    yield ('specialise', goal, (), (rule, terms))
+                else:
+                    specialise = ('specialise', None, (), (rule, terms))
+                    plans = self._all((rule.instance(terms, rule.antecedent),), depth - 1)
+                    yield plans and ('modus_ponens', goal, (specialise,) + plans, None)
+        if self.goal_directed:
+            return
+        for identity in self._identities:
+            x, y = identity.terms
+            for old, new in ((x, y), (y, x)):
+                if old in goal.free():
+                    plans = self._all((goal.substitute({old: new}),), depth - 1)
+                    yield plans and ('substitute_equal', goal, plans, identity)
+        if isinstance(goal, ExistentialQuantifier):
+            for witness in product(self.terms, repeat=len(goal.terms)):
+                if len(set(witness)) < len(witness):
+                    continue
+                instance = goal.open(witness)
+                if ExistentialQuantifier(witness, instance) == goal:
+                    plans = self._all((instance,), depth - 1)
+                    yield plans and ('generalize', goal, plans, witness)
+
+    def _emit(self, plan):
+        '''replay plan, returning the formula it derives'''
+        rule, goal, plans, args = plan
+        derived = [self._emit(sub) for sub in plans]
+        p = self.context
+        if rule == 'specialise':
+            goal = args[0].instance(args[1])
+        if goal in p.facts:
+            return goal
+        if rule == 'conjunction':
+            p.conjunction(goal.left, goal.right)
+        elif rule == 'left':
+            p.deduce_left(derived[0])
+        elif rule == 'right':
+            p.deduce_right(derived[0])
+        elif rule == 'modus_ponens':
+            p.modus_ponens2(derived[1], goal)
+        elif rule == 'specialise':
+            assert p.specialise(args[0].fact, args[1]) == goal
+        elif rule == 'substitute_equal':
+            p.substitute_equal(derived[0], goal, args)
+        elif rule == 'generalize':
+            p.generalize(args, derived[0])
+        return goal
+
+
+def prove_statement(context, statement, **budget):
+    '''prove a closed statement A(x..): P(x..) -> C(x..) or A(x..): C(x..)
+    by assuming P and searching for C in a new context.
+
+    Returns the proved statement, or None, and the search, whose nodes and
+    elapsed time are the statistics of the run.
+    '''
+    if isinstance(statement, UniversalQuantifier):
+        variables = context.start_context(len(statement.terms))
+        body = statement.open(variables)
+    else:
+        context.start_context(0)
+        body = statement
+    if isinstance(body, BinaryConnective) and body.connective == '->':
+        context.assume(body.left)
+        goal = body.right
+    else:
+        goal = body
+    search = Search(context, **budget)
+    if search.prove(goal) is None:
+        context.abandon()
+        return None, search
+    return context.directproof(goal), search
+
+
+def check_regressions():
+    '''searches that once failed to replay their plans'''
+    from log import SilentLog
+    from proof import ProofContext
+    from tarski import axioms, equality_axioms, Between, Congruent
+    # modus ponens with a premise from a universal fact without antecedent
+    for goal_directed in (False, True):
+        p = ProofContext(axioms+equality_axioms, log=SilentLog())
+        a, b, c = p.start_context(3)
+        p.assume(Congruent(a,b,b,a) > Between(a,b,c))
+        assert Search(p, goal_directed=goal_directed).prove(Between(a,b,c)) == Between(a,b,c)
+
+
+if __name__ == '__main__':
+    check_regressions()
+    print('ok')